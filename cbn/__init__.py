@@ -1,11 +1,12 @@
 __version__ = "0.0.1"
 
+from contextlib import contextmanager
 
 import frappe
 from frappe import _
 from frappe.model.meta import get_field_precision
 from frappe.utils import (
-	flt
+	flt, get_datetime
 )
 
 
@@ -17,6 +18,7 @@ from erpnext.stock.doctype.stock_entry.stock_entry import StockEntry
 from erpnext.stock import stock_ledger
 from erpnext.stock.stock_ledger import (
 	NegativeStockError,
+	make_sl_entries as erpnext_make_sl_entries,
 	get_future_sle_with_negative_batch_qty,
 	get_future_sle_with_negative_qty, 
 	is_negative_stock_allowed, is_negative_with_precision,
@@ -164,20 +166,17 @@ def validate_negative_qty_in_future_sle(args, allow_negative_stock=False):
 			frappe.throw(message, NegativeStockError, title=_("Insufficient Stock for Batch"))
 
 	if args.custom_batch:
-		neg_batch_sle = get_future_sle_with_negative_batch_manufactur_qty(args)
-		if is_negative_with_precision(neg_batch_sle, is_batch=True):
-			message = _(
-				"{0} units of {1} Batch {2} needed in {3} on {4} {5} for {6} to complete this transaction."
-			).format(
-				abs(neg_batch_sle[0]["cumulative_total"]),
-				frappe.get_desk_link("Item", args.item_code),
-				frappe.get_desk_link("Batch Manufacture", args.custom_batch),
-				frappe.get_desk_link("Warehouse", args.warehouse),
-				neg_batch_sle[0]["posting_date"],
-				neg_batch_sle[0]["posting_time"],
-				frappe.get_desk_link(neg_batch_sle[0]["voucher_type"], neg_batch_sle[0]["voucher_no"]),
-			)
-			frappe.throw(message, NegativeStockError, title=_("Insufficient Stock for Batch"))
+		future_checks = frappe.flags.batch_manufacture_future_checks
+		if future_checks is not None:
+			# divalidasi sekaligus setelah semua sle voucher masuk
+			key = (args.item_code, args.warehouse, args.custom_batch)
+			posting_datetime = get_datetime(args.posting_datetime)
+			if key not in future_checks or posting_datetime < future_checks[key]:
+				future_checks[key] = posting_datetime
+		else:
+			neg_batch_sle = get_future_sle_with_negative_batch_manufactur_qty(args)
+			if is_negative_with_precision(neg_batch_sle, is_batch=True):
+				throw_negative_batch_manufacture_error(neg_batch_sle[0], args)
 			
 	if args.reserved_stock:
 		validate_reserved_stock(args)
@@ -207,6 +206,87 @@ def get_future_sle_with_negative_batch_manufactur_qty(args):
 		as_dict=1,
 	)
 
+def throw_negative_batch_manufacture_error(neg_batch_sle, args):
+	message = _(
+		"{0} units of {1} Batch {2} needed in {3} on {4} {5} for {6} to complete this transaction."
+	).format(
+		abs(neg_batch_sle["cumulative_total"]),
+		frappe.get_desk_link("Item", args.item_code),
+		frappe.get_desk_link("Batch Manufacture", args.custom_batch),
+		frappe.get_desk_link("Warehouse", args.warehouse),
+		neg_batch_sle["posting_date"],
+		neg_batch_sle["posting_time"],
+		frappe.get_desk_link(neg_batch_sle["voucher_type"], neg_batch_sle["voucher_no"]),
+	)
+	frappe.throw(message, NegativeStockError, title=_("Insufficient Stock for Batch"))
+
+@contextmanager
+def defer_future_batch_manufacture_check():
+	"""Collect the custom_batch keys validated inside the block and check them in one query at the end"""
+	previous = frappe.flags.batch_manufacture_future_checks
+	frappe.flags.batch_manufacture_future_checks = future_checks = {}
+	try:
+		yield
+	finally:
+		frappe.flags.batch_manufacture_future_checks = previous
+
+	validate_future_negative_batch_manufacture_qty(future_checks)
+
+def validate_future_negative_batch_manufacture_qty(future_checks):
+	for neg_batch_sle in get_future_sles_with_negative_batch_manufacture_qty(future_checks):
+		if is_negative_with_precision([neg_batch_sle], is_batch=True):
+			throw_negative_batch_manufacture_error(neg_batch_sle, neg_batch_sle)
+
+def get_future_sles_with_negative_batch_manufacture_qty(future_checks):
+	"""First future negative balance of every (item_code, warehouse, custom_batch) key,
+	`future_checks` maps each key to the posting datetime it is checked from"""
+	if not future_checks:
+		return []
+
+	keys, values, thresholds = [], [], []
+	for (item_code, warehouse, custom_batch) in future_checks:
+		keys.append("(%s, %s, %s)")
+		values.extend([item_code, warehouse, custom_batch])
+
+	for (item_code, warehouse, custom_batch), posting_datetime in future_checks.items():
+		thresholds.append("(item_code = %s and warehouse = %s and custom_batch = %s and posting_datetime >= %s)")
+		values.extend([item_code, warehouse, custom_batch, posting_datetime])
+
+	return frappe.db.sql(
+		"""
+		with batch_ledger as (
+			select
+				item_code, warehouse, custom_batch, creation,
+				posting_date, posting_time, posting_datetime, voucher_type, voucher_no,
+				sum(actual_qty) over (
+					partition by item_code, warehouse, custom_batch
+					order by posting_datetime, creation
+				) as cumulative_total
+			from `tabStock Ledger Entry`
+			where
+				(item_code, warehouse, custom_batch) in ({keys})
+				and is_cancelled = 0
+		),
+		negative_ledger as (
+			select
+				*,
+				row_number() over (
+					partition by item_code, warehouse, custom_batch
+					order by posting_datetime, creation
+				) as row_no
+			from batch_ledger
+			where
+				cumulative_total < 0.0
+				and ({thresholds})
+		)
+		select * from negative_ledger
+		where row_no = 1
+		order by posting_datetime, creation
+	""".format(keys=", ".join(keys), thresholds=" or ".join(thresholds)),
+		values,
+		as_dict=1,
+	)
+
 def custom_get_overlap_for(self, args, open_job_cards=None):
 	time_logs = []
 
@@ -287,6 +367,12 @@ def validate_quantity(doc, args, ref, valid_items, already_returned_items):
 					sales_and_purchase_return.StockOverReturnError,
 				)
 
+def make_sl_entries(sl_entries, allow_negative_stock=False, via_landed_cost_voucher=False):
+	from cbn.cbn.batch_manufacture import defer_batch_manufacture
+
+	with defer_future_batch_manufacture_check(), defer_batch_manufacture():
+		erpnext_make_sl_entries(sl_entries, allow_negative_stock, via_landed_cost_voucher)
+
 # tambahan ketika custom batch terisi mengikuti actual qty
 def get_stock_reco_qty_shift(args):
 	stock_reco_qty_shift = 0
@@ -318,5 +404,6 @@ StockController.get_sl_entries = get_sl_entries
 StockController.update_bundle_details = update_bundle_details
 JobCard.get_overlap_for = custom_get_overlap_for
 stock_ledger.get_stock_reco_qty_shift = get_stock_reco_qty_shift
+stock_ledger.make_sl_entries = make_sl_entries
 stock_ledger.validate_negative_qty_in_future_sle = validate_negative_qty_in_future_sle
 sales_and_purchase_return.validate_quantity = validate_quantity
\ No newline at end of file
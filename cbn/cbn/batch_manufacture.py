@@ -1,12 +1,24 @@
 # Copyright (c) 2024, DAS and Contributors
 # License: GNU General Public License v3. See license.txt
 from collections import defaultdict
+from contextlib import contextmanager
 
 import frappe
 from frappe import _, bold
 
-from frappe.utils import flt
-from cbn.cbn.doctype.batch_manufacture.batch_manufacture import get_auto_batch_manufacture, get_available_batches
+from frappe.query_builder.functions import Sum
+from frappe.utils import flt, getdate, today
+from cbn.cbn.doctype.batch_manufacture.batch_manufacture import get_auto_batch_manufacture
+from cbn.cbn.doctype.batch_manufacture_bin.batch_manufacture_bin import (
+	get_batch_manufacture_bin_qty,
+	update_batch_manufacture_bin,
+)
+from cbn.cbn.doctype.batch_manufacture_daily_summary.batch_manufacture_daily_summary import (
+	update_daily_summary,
+)
+from cbn.cbn.doctype.batch_manufacture_period_balance.batch_manufacture_period_balance import (
+	invalidate_period_balances,
+)
 
 class BatchNegativeStockError(frappe.ValidationError):
 	pass
@@ -16,6 +28,7 @@ class BatchManufacture:
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+        self.update_bin()
         self.set_item_details()
         if not self.item_details.custom_has_batch_manufacture:
             return
@@ -23,7 +36,8 @@ class BatchManufacture:
         self.process_batch_manufacture()
         self.validate_batch_inventory()
 
-        self.post_process()
+        if not getattr(self, "skip_batch_qty", False):
+            self.post_process()
     
     def process_batch_manufacture(self):
         bm_setting = frappe.get_cached_doc("Batch Manufacture Settings")
@@ -32,6 +46,9 @@ class BatchManufacture:
         else "Sub Assembly" if self.item_details.item_group == bm_setting.sa_item_group 
         else frappe.throw("The Item Group {} is neither a production item, conversion nor a sub-assembly.".format(self.item_details.item_group)))
 
+    def update_bin(self):
+        update_batch_manufacture_bin(self.sle.item_code, self.sle.warehouse, self.sle.custom_batch, self.sle.actual_qty)
+
     def set_item_details(self):
         fields = [
             "item_name",
@@ -50,31 +67,18 @@ class BatchManufacture:
         if self.sle.allow_negative_stock:
             return
 
-        available_batches = get_available_batches(
-            frappe._dict(
-                {
-                    "item_code": self.sle.item_code,
-                    "warehouse": self.sle.warehouse,
-                    "batch_no": batch_manufacture,
-                    "posting_date": self.sle.posting_date,
-                    "posting_time": self.sle.posting_time,
-                    "ignore_voucher_nos": [self.sle.voucher_no],
-                }
-            )
-        )
-
-        if not available_batches:
+        batch = frappe.get_cached_value("Batch Manufacture", batch_manufacture, ["disabled", "expiry_date"], as_dict=1)
+        if not batch or batch.disabled or (batch.expiry_date and getdate(batch.expiry_date) < getdate(today())):
             return
 
-        available_batches = get_available_batches_qty(available_batches)
-        
-        if batch_manufacture in available_batches and available_batches[batch_manufacture] < 0:
-            if flt(available_batches.get(batch_manufacture)) < 0:
-                self.validate_negative_batch(batch_manufacture, available_batches[batch_manufacture])
+        # bin sudah termasuk sle voucher ini, keluarkan agar yang dicek adalah stok sebelum voucher
+        available_qty = flt(
+            get_batch_manufacture_bin_qty(self.sle.item_code, self.sle.warehouse, batch_manufacture)
+            - get_voucher_batch_manufacture_qty(self.sle)
+        )
 
-            self.throw_error_message(
-                f"Batch {bold(batch_manufacture)} is not available in the selected warehouse {self.warehouse}"
-            )
+        if available_qty < 0:
+            self.validate_negative_batch(batch_manufacture, available_qty)
 
     def validate_negative_batch(self, batch_no, available_qty):
         if available_qty < 0:
@@ -89,16 +93,8 @@ class BatchManufacture:
         if self.item_details.custom_has_batch_manufacture:
             self.update_batch_qty()
           
-    def update_batch_qty(self):
+    def update_batch_qty(self, qty=None):
         batch_no = self.sle.custom_batch
-        available_batches = get_auto_batch_manufacture(
-            frappe._dict({"item_code": self.sle.item_code, "batch_no": self.sle.custom_batch })
-        )
-
-        batches_qty = defaultdict(float)
-        for batch in available_batches:
-            batches_qty[batch.get("batch_manufacture")] += batch.get("qty")
-
         condition = {
 			"Production": ["Batch Manufacture", batch_no],
 			"Sub Assembly": ["Batch Manufacture Sub Assembly", {"parent": batch_no, "item_code": self.sle.item_code}],
@@ -111,14 +107,176 @@ class BatchManufacture:
         if self.item_type == "Sub Assembly" and not frappe.db.exists(condition[0], condition[1]):
             frappe.throw("Item {} not registered in Batch Manufacture {}".format(self.sle.item_code, batch_no))
 
+        if frappe.get_cached_doc("Batch Manufacture Settings").update_batch_qty_by_delta:
+            # sama seperti hitung ulang di bawah: batch expired / disabled bernilai 0
+            if not is_active_batch_manufacture(batch_no):
+                frappe.db.set_value(condition[0], condition[1], "batch_qty", 0)
+                return
+
+            update_batch_qty_by_delta(
+                condition[0], condition[1], get_positive_qty_delta(self.sle) if qty is None else qty
+            )
+            return
+
+        available_batches = get_auto_batch_manufacture(
+            frappe._dict({"item_code": self.sle.item_code, "batch_no": self.sle.custom_batch })
+        )
+
+        batches_qty = defaultdict(float)
+        for batch in available_batches:
+            batches_qty[batch.get("batch_manufacture")] += batch.get("qty")
+
         frappe.db.set_value(condition[0], condition[1], "batch_qty", batches_qty.get(batch_no, 0))
 
     def throw_error_message(self, message, exception=frappe.ValidationError):
         frappe.throw(_(message), exception, title=_("Error"))  
 
+@contextmanager
+def defer_batch_manufacture():
+	"""Collect the SLEs submitted inside the block and process them together once all are inserted"""
+	previous = frappe.flags.batch_manufacture_sl_entries
+	frappe.flags.batch_manufacture_sl_entries = sl_entries = []
+	try:
+		yield
+	finally:
+		frappe.flags.batch_manufacture_sl_entries = previous
+
+	make_batch_manufacture_entries(sl_entries)
+
+def make_batch_manufacture_entries(sl_entries):
+	# satu proses per item, gudang dan batch
+	grouped_sle, posting_dates = {}, {}
+	for sle in sl_entries:
+		if sle.custom_batch and (sle.company not in posting_dates or getdate(sle.posting_date) < posting_dates[sle.company]):
+			posting_dates[sle.company] = getdate(sle.posting_date)
+
+		key = (sle.item_code, sle.warehouse, sle.custom_batch)
+		if key in grouped_sle:
+			grouped_sle[key].actual_qty += flt(sle.actual_qty)
+			continue
+
+		grouped_sle[key] = frappe._dict(sle.as_dict(), allow_negative_stock=sle.get("allow_negative_stock"))
+
+	for company, posting_date in posting_dates.items():
+		invalidate_period_balances(company, posting_date)
+
+	for sle in grouped_sle.values():
+		update_daily_summary(sle)
+
+	# satu update batch qty per item dan batch
+	update_by_delta = frappe.get_cached_doc("Batch Manufacture Settings").update_batch_qty_by_delta
+	batch_qty = {}
+	for sle in grouped_sle.values():
+		batch_manufacture = BatchManufacture(
+			sle=sle,
+			item_code=sle.item_code,
+			warehouse=sle.warehouse,
+			company=sle.company,
+			skip_batch_qty=True,
+		)
+
+		if not batch_manufacture.item_details.custom_has_batch_manufacture:
+			continue
+
+		qty = get_positive_qty_delta(sle) if update_by_delta else flt(sle.actual_qty)
+		key = (sle.item_code, sle.custom_batch)
+		if key in batch_qty:
+			batch_qty[key][1] += qty
+		else:
+			batch_qty[key] = [batch_manufacture, qty]
+
+	for batch_manufacture, qty in batch_qty.values():
+		batch_manufacture.update_batch_qty(qty)
+
 def get_available_batches_qty(available_batches):
 	available_batches_qty = defaultdict(float)
 	for batch in available_batches:
 		available_batches_qty[batch.batch_manufacture] += batch.qty
 
-	return available_batches_qty
\ No newline at end of file
+	return available_batches_qty
+
+def is_active_batch_manufacture(batch_no):
+	batch = frappe.get_cached_value("Batch Manufacture", batch_no, ["disabled", "expiry_date"], as_dict=1)
+	return bool(batch) and not batch.disabled and not (batch.expiry_date and getdate(batch.expiry_date) < getdate(today()))
+
+def get_positive_qty_delta(sle):
+	"""Change of the batch qty from one warehouse, like `get_auto_batch_manufacture` only stock above zero counts.
+	The bin already holds the sle's qty."""
+	bin_qty = get_batch_manufacture_bin_qty(sle.item_code, sle.warehouse, sle.custom_batch)
+	return max(bin_qty, 0) - max(bin_qty - flt(sle.actual_qty), 0)
+
+def update_batch_qty_by_delta(doctype, filters, qty):
+	if not flt(qty):
+		return
+
+	table = frappe.qb.DocType(doctype)
+	query = frappe.qb.update(table).set(table.batch_qty, table.batch_qty + flt(qty))
+
+	if isinstance(filters, dict):
+		for field, value in filters.items():
+			query = query.where(table[field] == value)
+	else:
+		query = query.where(table.name == filters)
+
+	query.run()
+
+def reconcile_batch_qty():
+	"""Daily job, correct batch qty that drifted from the ledger while it was updated incrementally.
+	Counted the same way as `get_auto_batch_manufacture`: warehouses above zero of batches not expired or disabled."""
+	if not frappe.db.get_single_value("Batch Manufacture Settings", "update_batch_qty_by_delta"):
+		return
+
+	sle = frappe.qb.DocType("Stock Ledger Entry")
+	ledger_qty = defaultdict(float)
+	for d in (
+		frappe.qb.from_(sle)
+		.select(sle.item_code, sle.custom_batch, sle.warehouse, Sum(sle.actual_qty).as_("qty"))
+		.where((sle.is_cancelled == 0) & (sle.custom_batch.isnotnull()) & (sle.custom_batch != ""))
+		.groupby(sle.item_code, sle.custom_batch, sle.warehouse)
+	).run(as_dict=True):
+		if flt(d.qty) > 0:
+			ledger_qty[(d.item_code, d.custom_batch)] += flt(d.qty)
+
+	inactive_batches = set(
+		frappe.get_all(
+			"Batch Manufacture",
+			or_filters={"disabled": 1, "expiry_date": ("<", today())},
+			pluck="name",
+		)
+	)
+
+	precision = frappe.get_precision("Batch Manufacture", "batch_qty")
+	drift = []
+	for doctype, batch_field in (
+		("Batch Manufacture", "name"),
+		("Batch Manufacture Sub Assembly", "parent"),
+		("Batch Manufacture Conversion", "parent"),
+	):
+		for d in frappe.get_all(doctype, fields=["name", "item_code", "batch_qty", f"{batch_field} as batch"]):
+			qty = 0.0 if d.batch in inactive_batches else flt(ledger_qty.get((d.item_code, d.batch)), precision)
+			if qty == flt(d.batch_qty, precision):
+				continue
+
+			drift.append(f"{doctype} {d.name} ({d.item_code}, {d.batch}): {flt(d.batch_qty, precision)} -> {qty}")
+			frappe.db.set_value(doctype, d.name, "batch_qty", qty, update_modified=False)
+
+	if drift:
+		frappe.log_error(title="Batch Manufacture qty drift", message="\n".join(drift))
+
+def get_voucher_batch_manufacture_qty(sle):
+	"""Qty the voucher has already posted to the bin of the sle's item, warehouse and batch"""
+	sle_table = frappe.qb.DocType("Stock Ledger Entry")
+
+	qty = (
+		frappe.qb.from_(sle_table)
+		.select(Sum(sle_table.actual_qty))
+		.where(
+			(sle_table.voucher_type == sle.voucher_type)
+			& (sle_table.voucher_no == sle.voucher_no)
+			& (sle_table.item_code == sle.item_code)
+			& (sle_table.warehouse == sle.warehouse)
+			& (sle_table.custom_batch == sle.custom_batch)
+		)
+	).run()
+
+	return flt(qty[0][0]) if qty else 0.0
@@ -0,0 +1,289 @@
+# Copyright (c) 2025, DAS and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from collections import OrderedDict
+
+import frappe
+from frappe.query_builder.functions import Min
+from frappe.utils import flt
+
+BOM_CACHE = "cbn_bom_cache"
+BOM_CACHE_GENERATION = "cbn_bom_cache_generation"
+PROCESS_CACHE_SIZE = 512
+
+# level pertama, per worker: (site, bom, kind) -> (modified, generation, value)
+_process_cache = OrderedDict()
+bom_cache_metrics = {"process_hit": 0, "redis_hit": 0, "miss": 0}
+
+
+def get_bom_modified(bom):
+	"""Version of the BOM, read once per request"""
+	if frappe.flags.bom_modified is None:
+		frappe.flags.bom_modified = {}
+
+	if bom not in frappe.flags.bom_modified:
+		frappe.flags.bom_modified[bom] = str(frappe.db.get_value("BOM", bom, "modified"))
+
+	return frappe.flags.bom_modified[bom]
+
+
+def get_bom_cache_generation():
+	"""Token in redis that changes on every invalidation, read once per request.
+	Worker entries from an older generation may have been cleared on another worker."""
+	if frappe.flags.bom_cache_generation is None:
+		generation = frappe.cache.get_value(BOM_CACHE_GENERATION)
+		if not generation:
+			generation = bump_bom_cache_generation()
+
+		frappe.flags.bom_cache_generation = generation
+
+	return frappe.flags.bom_cache_generation
+
+
+def bump_bom_cache_generation():
+	generation = frappe.generate_hash(length=10)
+	frappe.cache.set_value(BOM_CACHE_GENERATION, generation)
+	frappe.flags.bom_cache_generation = generation
+
+	return generation
+
+
+def get_cached_bom_data(bom, kind, loader, modified=None):
+	"""Data derived from one version of a BOM, looked up in the worker LRU, then redis, then built by `loader`.
+	The value is shared, callers copy it before changing it."""
+	modified = modified or get_bom_modified(bom)
+
+	found, value = get_bom_cache(bom, kind, modified)
+	if not found:
+		value = loader()
+		set_bom_cache(bom, kind, modified, value)
+
+	return value
+
+
+def get_bom_cache(bom, kind, modified):
+	key = (frappe.local.site, bom, kind)
+	entry = _process_cache.get(key)
+	if entry and entry[0] == modified and entry[1] == get_bom_cache_generation():
+		_process_cache.move_to_end(key)
+		bom_cache_metrics["process_hit"] += 1
+		return True, entry[2]
+
+	cached = frappe.cache.hget(BOM_CACHE, bom)
+	if cached and cached.get("modified") == modified and kind in cached:
+		bom_cache_metrics["redis_hit"] += 1
+		set_process_cache(key, modified, cached[kind])
+		return True, cached[kind]
+
+	bom_cache_metrics["miss"] += 1
+	return False, None
+
+
+def set_bom_cache(bom, kind, modified, value):
+	set_process_cache((frappe.local.site, bom, kind), modified, value)
+
+	# semua data satu BOM disimpan di satu field redis, versi lama ikut terbuang
+	cached = frappe.cache.hget(BOM_CACHE, bom)
+	if not cached or cached.get("modified") != modified:
+		cached = {"modified": modified}
+
+	cached[kind] = value
+	frappe.cache.hset(BOM_CACHE, bom, cached)
+
+
+def set_process_cache(key, modified, value):
+	_process_cache[key] = (modified, get_bom_cache_generation(), value)
+	_process_cache.move_to_end(key)
+	while len(_process_cache) > PROCESS_CACHE_SIZE:
+		_process_cache.popitem(last=False)
+
+
+@frappe.whitelist()
+def get_bom_cache_metrics():
+	frappe.only_for("System Manager")
+	return {**bom_cache_metrics, "process_entries": len(_process_cache)}
+
+
+def get_bom_explosion_items(bom_nos):
+	"""Flattened explosion rows per unit of each submitted BOM in `bom_nos`.
+	Entries are cached per (bom, modified), the BOMs missing from cache are read with one query."""
+	bom_nos = list({d for d in bom_nos if d})
+	if not bom_nos:
+		return {}
+
+	modified = {
+		d.name: str(d.modified)
+		for d in frappe.get_all(
+			"BOM", filters={"name": ("in", bom_nos), "docstatus": 1}, fields=["name", "modified"]
+		)
+	}
+
+	explosion, missing = {}, []
+	for bom in bom_nos:
+		if bom not in modified:
+			explosion[bom] = []
+			continue
+
+		found, value = get_bom_cache(bom, "explosion", modified[bom])
+		if found:
+			explosion[bom] = value
+		else:
+			missing.append(bom)
+
+	if missing:
+		# Did not use qty_consumed_per_unit in the query, as it leads to rounding loss
+		rows = frappe.db.sql(
+			"""
+			SELECT
+				bom_item.parent AS bom_no,
+				bom_item.item_code,
+				bom_item.item_name,
+				bom_item.perintah_produksi,
+				bom_item.description,
+				bom_item.source_warehouse,
+				bom_item.operation,
+				bom_item.stock_uom,
+				bom_item.stock_qty,
+				bom_item.rate,
+				bom_item.include_item_in_manufacturing,
+				bom_item.sourced_by_supplier,
+				bom_item.stock_qty / ifnull(bom.quantity, 1) AS qty_consumed_per_unit
+			FROM `tabBOM Explosion Item` bom_item, `tabBOM` bom
+			WHERE
+				bom_item.parent = bom.name
+				AND bom.name IN %(boms)s
+				AND bom.docstatus = 1
+			ORDER BY bom_item.parent, bom_item.idx
+		""",
+			{"boms": missing},
+			as_dict=1,
+		)
+
+		for bom in missing:
+			explosion[bom] = []
+
+		for d in rows:
+			explosion[d.pop("bom_no")].append(d)
+
+		for bom in missing:
+			set_bom_cache(bom, "explosion", modified[bom], explosion[bom])
+
+	return explosion
+
+
+def get_bom_item_order(bom):
+	"""item_code -> first idx of the item in the BOM lines, used to order its explosion rows"""
+
+	def load_order():
+		bom_item = frappe.qb.DocType("BOM Item")
+		return dict(
+			(
+				frappe.qb.from_(bom_item)
+				.select(bom_item.item_code, Min(bom_item.idx))
+				.where((bom_item.parent == bom) & (bom_item.parenttype == "BOM"))
+				.groupby(bom_item.item_code)
+			).run()
+		)
+
+	return get_cached_bom_data(bom, "item_order", load_order)
+
+
+def get_bom_item_qty(bom):
+	"""item_code -> qty of the BOM lines, first line wins like the old per-call fetch"""
+
+	def load_qty():
+		item_qty = {}
+		for d in frappe.get_all("BOM Item", filters={"parent": bom, "parenttype": "BOM"}, fields=["item_code", "qty"], order_by="idx"):
+			item_qty.setdefault(d.item_code, flt(d.qty))
+
+		return item_qty
+
+	return get_cached_bom_data(bom, "item_qty", load_qty)
+
+
+def get_bom_header(bom):
+	return get_cached_bom_data(
+		bom, "header", lambda: frappe.db.get_value("BOM", bom, ["item", "quantity", "company"], as_dict=1)
+	)
+
+
+def get_ancestor_boms(bom):
+	"""Every BOM that uses `bom` somewhere down its tree, walked one level per query"""
+	ancestors, current = set(), {bom}
+	while current:
+		parents = set(
+			frappe.get_all(
+				"BOM Item",
+				filters={"bom_no": ("in", list(current)), "parenttype": "BOM"},
+				pluck="parent",
+				distinct=True,
+			)
+		)
+		current = parents - ancestors - {bom}
+		ancestors |= current
+
+	return ancestors
+
+
+def clear_bom_explosion_cache(doc, method=None):
+	"""A changed BOM makes its own explosion and the ones of its ancestors stale"""
+	boms = {doc.name} | get_ancestor_boms(doc.name)
+	for bom in boms:
+		frappe.cache.hdel(BOM_CACHE, bom)
+
+	# worker lain membuang entri lamanya saat melihat generation baru
+	bump_bom_cache_generation()
+	for key in [key for key in _process_cache if key[1] in boms]:
+		_process_cache.pop(key, None)
+
+	if frappe.flags.bom_modified:
+		for bom in boms:
+			frappe.flags.bom_modified.pop(bom, None)
+
+
+def explode_bom_items(items):
+	"""Flatten BOM rows, a row with a child BOM is replaced by that BOM's explosion scaled to its stock qty"""
+	explosion = get_bom_explosion_items([d.bom_no for d in items if d.bom_no])
+
+	exploded_items = []
+	for d in items:
+		if d.bom_no:
+			for child in explosion.get(d.bom_no, []):
+				exploded_items.append(
+					frappe._dict(
+						{
+							"item_code": child["item_code"],
+							"item_name": child["item_name"],
+							"perintah_produksi": child["perintah_produksi"],
+							"source_warehouse": child["source_warehouse"],
+							"operation": child["operation"],
+							"description": child["description"],
+							"stock_uom": child["stock_uom"],
+							"stock_qty": child["qty_consumed_per_unit"] * d.stock_qty,
+							"rate": flt(child["rate"]),
+							"include_item_in_manufacturing": child.get("include_item_in_manufacturing", 0),
+							"sourced_by_supplier": child.get("sourced_by_supplier", 0),
+						}
+					)
+				)
+		elif d.item_code:
+			exploded_items.append(
+				frappe._dict(
+					{
+						"item_code": d.item_code,
+						"item_name": d.item_name,
+						"operation": d.operation,
+						"source_warehouse": d.source_warehouse,
+						"description": d.description,
+						"perintah_produksi": d.get("perintah_produksi"),
+						"image": d.image,
+						"stock_uom": d.stock_uom,
+						"stock_qty": flt(d.stock_qty),
+						"rate": flt(d.base_rate) / (flt(d.conversion_factor) or 1.0),
+						"include_item_in_manufacturing": d.include_item_in_manufacturing,
+						"sourced_by_supplier": d.sourced_by_supplier,
+					}
+				)
+			)
+
+	return exploded_items
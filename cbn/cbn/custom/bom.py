@@ -4,6 +4,8 @@
 import frappe
 from frappe.utils.data import cint, flt
 
+from cbn.cbn.bom_explosion import get_bom_item_order, get_cached_bom_data
+
 
 def get_bom_items_as_dict(
 	bom,
@@ -16,74 +18,83 @@ def get_bom_items_as_dict(
 ):
 	item_dict = {}
 
+	# hanya kolom dari BOM yang disimpan di cache BOM, data item dibaca ulang di bawah
 	# Did not use qty_consumed_per_unit in the query, as it leads to rounding loss
 	query = """select
 				bom_item.item_code,
 				bom_item.perintah_produksi,
 				bom_item.idx,
-				item.item_name,
-				sum(bom_item.{qty_field}/ifnull(bom.quantity, 1)) * %(qty)s as qty,
-				item.image,
+				sum(bom_item.{qty_field}/ifnull(bom.quantity, 1)) as qty,
 				bom.project,
 				bom_item.rate,
-				sum(bom_item.{qty_field}/ifnull(bom.quantity, 1)) * bom_item.rate * %(qty)s as amount,
-				item.stock_uom,
-				item.item_group,
-				item.allow_alternative_item,
-				item_default.default_warehouse,
-				item_default.expense_account as expense_account,
-				item_default.buying_cost_center as cost_center
+				sum(bom_item.{qty_field}/ifnull(bom.quantity, 1)) * bom_item.rate as amount
 				{select_columns}
 			from
 				`tab{table}` bom_item
 				JOIN `tabBOM` bom ON bom_item.parent = bom.name
-				JOIN `tabItem` item ON item.name = bom_item.item_code
-				LEFT JOIN `tabItem Default` item_default
-					ON item_default.parent = item.name and item_default.company = %(company)s
 			where
 				bom_item.docstatus < 2
 				and bom.name = %(bom)s
-				and item.is_stock_item in (1, {is_stock_item})
 				{where_conditions}
-				group by item_code, stock_uom, perintah_produksi
+				group by item_code, perintah_produksi
 				order by idx"""
 
-	is_stock_item = 0 if include_non_stock_items else 1
-	if cint(fetch_exploded):
-		query = query.format(
-			table="BOM Explosion Item",
-			where_conditions="",
-			is_stock_item=is_stock_item,
-			qty_field="stock_qty",
-			select_columns=""", bom_item.source_warehouse, bom_item.operation,
-				bom_item.include_item_in_manufacturing, bom_item.description, bom_item.rate, bom_item.sourced_by_supplier,
-				(Select idx from `tabBOM Item` where item_code = bom_item.item_code and parent = %(parent)s limit 1) as idx""",
-		)
-
-		items = frappe.db.sql(
-			query, {"parent": bom, "qty": qty, "bom": bom, "company": company}, as_dict=True
-		)
-	elif fetch_scrap_items:
-		query = query.format(
-			table="BOM Scrap Item",
-			where_conditions="",
-			select_columns=", item.description",
-			is_stock_item=is_stock_item,
-			qty_field="stock_qty",
-		)
-
-		items = frappe.db.sql(query, {"qty": qty, "bom": bom, "company": company}, as_dict=True)
-	else:
-		query = query.format(
-			table="BOM Item",
-			where_conditions="",
-			is_stock_item=is_stock_item,
-			qty_field="stock_qty" if fetch_qty_in_stock_uom else "qty",
-			select_columns=""", bom_item.perintah_produksi, bom_item.uom, bom_item.conversion_factor, bom_item.source_warehouse,
-				bom_item.operation, bom_item.include_item_in_manufacturing, bom_item.sourced_by_supplier,
-				bom_item.description, bom_item.base_rate as rate, bom_item.bom_no """,
-		)
-		items = frappe.db.sql(query, {"qty": qty, "bom": bom, "company": company}, as_dict=True)
+	def load_items():
+		if cint(fetch_exploded):
+			sql = query.format(
+				table="BOM Explosion Item",
+				where_conditions="",
+				qty_field="stock_qty",
+				select_columns=""", bom_item.source_warehouse, bom_item.operation,
+					bom_item.include_item_in_manufacturing, bom_item.description, bom_item.sourced_by_supplier""",
+			)
+
+			items = frappe.db.sql(sql, {"bom": bom}, as_dict=True)
+
+			# urutan mengikuti baris BOM, bukan urutan explosion
+			item_order = get_bom_item_order(bom)
+			for item in items:
+				item.idx = item_order.get(item.item_code)
+
+			items.sort(key=lambda d: d.idx or float("inf"))
+		elif fetch_scrap_items:
+			sql = query.format(
+				table="BOM Scrap Item",
+				where_conditions="",
+				select_columns="",
+				qty_field="stock_qty",
+			)
+
+			items = frappe.db.sql(sql, {"bom": bom}, as_dict=True)
+		else:
+			sql = query.format(
+				table="BOM Item",
+				where_conditions="",
+				qty_field="stock_qty" if fetch_qty_in_stock_uom else "qty",
+				select_columns=""", bom_item.uom, bom_item.conversion_factor, bom_item.source_warehouse,
+					bom_item.operation, bom_item.include_item_in_manufacturing, bom_item.sourced_by_supplier,
+					bom_item.description, bom_item.base_rate as rate, bom_item.bom_no """,
+			)
+			items = frappe.db.sql(sql, {"bom": bom}, as_dict=True)
+
+		return items
+
+	kind = "items_as_dict:{0}:{1}:{2}".format(cint(fetch_exploded), cint(fetch_scrap_items), cint(fetch_qty_in_stock_uom))
+	bom_items = get_cached_bom_data(bom, kind, load_items)
+	item_master = get_bom_item_details([d.item_code for d in bom_items], company)
+
+	items = []
+	for d in bom_items:
+		details = item_master.get(d.item_code)
+		if not details or not (details.is_stock_item or include_non_stock_items):
+			continue
+
+		item = frappe._dict(d, qty=flt(d.qty) * flt(qty), amount=flt(d.amount) * flt(qty))
+		item.update({k: v for k, v in details.items() if k not in ("is_stock_item", "description")})
+		if fetch_scrap_items and not cint(fetch_exploded):
+			item.description = details.description
+
+		items.append(item)
 
 	for item in items:
 		key = (item.item_code, item.perintah_produksi) if item.perintah_produksi else item.item_code
@@ -92,19 +103,77 @@ def get_bom_items_as_dict(
 		else:
 			item_dict.setdefault(key, item)
 
-	for item, item_details in item_dict.items():
-		for d in [
-			["Account", "expense_account", "stock_adjustment_account"],
-			["Cost Center", "cost_center", "cost_center"],
-			["Warehouse", "default_warehouse", ""],
-		]:
-			company_in_record = frappe.db.get_value(d[0], item_details.get(d[1]), "company")
+	for d in [
+		["Account", "expense_account", "stock_adjustment_account"],
+		["Cost Center", "cost_center", "cost_center"],
+		["Warehouse", "default_warehouse", ""],
+	]:
+		record_company = get_record_company(d[0], [item_details.get(d[1]) for item_details in item_dict.values()])
+		for item, item_details in item_dict.items():
+			company_in_record = record_company.get(item_details.get(d[1]))
 			if not item_details.get(d[1]) or (company_in_record and company != company_in_record):
 				item_dict[item][d[1]] = frappe.get_cached_value("Company", company, d[2]) if d[2] else None
 
 	return item_dict
 
 
+def get_bom_item_details(item_codes, company):
+	"""Item master and Item Default fields of the BOM rows, read on every call so item changes apply at once"""
+	item_codes = list(set(item_codes))
+	if not item_codes:
+		return {}
+
+	item = frappe.qb.DocType("Item")
+	item_default = frappe.qb.DocType("Item Default")
+
+	return {
+		d.item_code: d
+		for d in (
+			frappe.qb.from_(item)
+			.left_join(item_default)
+			.on((item_default.parent == item.name) & (item_default.company == company))
+			.select(
+				item.name.as_("item_code"),
+				item.item_name,
+				item.description,
+				item.image,
+				item.stock_uom,
+				item.item_group,
+				item.allow_alternative_item,
+				item.is_stock_item,
+				item_default.default_warehouse,
+				item_default.expense_account,
+				item_default.buying_cost_center.as_("cost_center"),
+			)
+			.where(item.name.isin(item_codes))
+		).run(as_dict=True)
+	}
+
+
+def get_record_company(doctype, names):
+	"""Company of each Account / Cost Center / Warehouse in `names`.
+	Kept in redis per record, a record never moves to another company so only unknown names are queried."""
+	names = {d for d in names if d}
+	if not names:
+		return {}
+
+	# satu field per record, hanya nama yang baru dikenal yang ditulis
+	key = f"cbn_record_company:{doctype}"
+	record_company = {}
+	for name in names:
+		if (company := frappe.cache.hget(key, name)) is not None:
+			record_company[name] = company
+
+	if missing := names - set(record_company):
+		for name, company in frappe.get_all(
+			doctype, filters={"name": ("in", list(missing))}, fields=["name", "company"], as_list=1
+		):
+			frappe.cache.hset(key, name, company)
+			record_company[name] = company
+
+	return record_company
+
+
 # Custom Krisna 06052025
 def calculate_total_qty(self, method):
     if not self.items:
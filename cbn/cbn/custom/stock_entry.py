@@ -2,8 +2,12 @@
 # License: GNU General Public License v3. See license.txt
 
 import frappe
+from frappe.model import child_table_fields, default_fields
 from frappe.utils import flt
 
+from cbn.cbn.doctype.perintah_produksi.perintah_produksi import get_perintah_produksi_warehouses
+from cbn.controllers.status_updater import update_child_values, update_percent_prev_doc
+
 def remove_qa_not_in_items(self, method=None):
     if not self.inspection_required:
         return
@@ -27,35 +31,45 @@ def validate_and_update_loss_item(self, method):
     if self.stock_entry_type not in ["Transfer Process Loss Item"]:
         return
 
-    ste_man = frappe.get_doc("Stock Entry", self.manufacture_stock_entry)
-    for d in ste_man.loss_items:
-        transferred_qty = frappe.get_all(
+    loss_items = frappe.get_all(
+        "Stock Entry Detail Loss",
+        filters={"parent": self.manufacture_stock_entry, "parenttype": "Stock Entry"},
+        fields=["name", "idx", "item_code", "qty"],
+        order_by="idx",
+    )
+    if not loss_items:
+        return
+
+    # qty yang sudah ditransfer per baris loss, satu query untuk semua baris
+    transferred = dict(
+        frappe.get_all(
             "Stock Entry Detail",
-            fields=["sum(qty) as qty"],
-            filters={
-                "ste_child_loss": d.name,
-                "docstatus": 1,
-            },
-        )[0].qty or 0.0
+            filters={"ste_child_loss": ("in", [d.name for d in loss_items]), "docstatus": 1},
+            fields=["ste_child_loss", "sum(qty) as qty"],
+            group_by="ste_child_loss",
+            as_list=1,
+        )
+    )
 
+    transferred_values = {}
+    for d in loss_items:
+        transferred_qty = flt(transferred.get(d.name))
         if d.qty < transferred_qty:
             frappe.throw("Row {}: quantity to transfer exceeds remaining quantity for Item {}.".format(d.idx, d.item_code))
 
-        d.db_set("transferred_qty", transferred_qty) 
+        transferred_values[d.name] = transferred_qty
+
+    update_child_values("Stock Entry Detail Loss", "transferred_qty", transferred_values, update_modified=True)
 
-    args = {
-        "source_dt": "Stock Entry Detail",
+    update_percent_prev_doc(self, {
         "target_field": "transferred_qty",
         "target_ref_field": "qty",
         "target_dt": "Stock Entry Detail Loss",
-        "join_field": "ste_child_loss",
         "target_parent_dt": "Stock Entry",
         "target_parent_field": "per_transferred_loss",
-        "source_field": "qty",
-        "percent_join_field_parent": "manufacture_stock_entry",
-    }
-
-    self._update_percent_field_in_targets(args, update_modified=True)
+        "percent_join_field": "manufacture_stock_entry",
+        "update_modified": ", modified = {}".format(frappe.db.escape(frappe.utils.now())),
+    })
 
 @frappe.whitelist()
 def make_stock_in_entry_loss_transfer(source_name, target_doc=None):
@@ -73,18 +87,27 @@ def make_stock_in_entry_loss_transfer(source_name, target_doc=None):
         if doc.get(f):
             target.set(f, doc.get(f))
 
-    for d in frappe.flags.args.trans_items:
-        d = frappe._dict(d)
+    trans_items = [frappe._dict(d) for d in frappe.flags.args.trans_items]
+
+    # baris loss dan gudang perintah produksi diambil sekaligus, bukan per baris
+    loss_items = {
+        d.name: d
+        for d in frappe.get_all(
+            "Stock Entry Detail Loss", filters={"name": ("in", [d.docname for d in trans_items])}, fields=["*"]
+        )
+    }
+    warehouses = get_perintah_produksi_warehouses(target.company)
+
+    for d in trans_items:
         if flt(d.good_qty + d.rejected_qty) > flt(d.transferred_qty + d.qty):
             frappe.throw("Row {}: quantity to transfer exceeds remaining quantity for Item {}.".format(d.idx, d.item_code))
-            
-        std = frappe.get_doc("Stock Entry Detail Loss", d.docname).as_dict(no_default_fields=True)
+
+        std = frappe._dict({
+            k: v for k, v in loss_items[d.docname].items() if k not in default_fields and k not in child_table_fields
+        })
         std.ste_child_loss = d.docname
-        
-        t_wh = frappe.get_value("Perintah Produksi Warehouse", {
-            "parent": std.perintah_produksi,
-            "company": target.company
-        }, ["good_warehouse", "rejected_warehouse"], as_dict=1)
+
+        t_wh = warehouses.get(std.perintah_produksi) or frappe._dict()
 
         if d.good_qty:
             target.append("items", {
@@ -92,14 +115,14 @@ def make_stock_in_entry_loss_transfer(source_name, target_doc=None):
                 "qty": d.good_qty,
                 "t_warehouse": t_wh.good_warehouse,
             })
-        
+
         if d.rejected_qty:
             target.append("items", {
                 **std,
                 "qty": d.rejected_qty,
                 "t_warehouse": t_wh.rejected_warehouse,
             })
-    
+
     target.set_purpose_for_stock_entry()
 
     return target
@@ -61,6 +61,10 @@ def get_qty_based_available_batches(available_batches, qty):
 	return batches
 
 def get_available_batches(kwargs):
+	# current balances don't need the ledger, the bin already holds them
+	if not kwargs.get("posting_date") and not kwargs.get("ignore_voucher_nos"):
+		return get_available_batches_from_bin(kwargs)
+
 	stock_ledger_entry = frappe.qb.DocType("Stock Ledger Entry")
 	batch_table = frappe.qb.DocType("Batch Manufacture")
 
@@ -78,9 +82,6 @@ def get_available_batches(kwargs):
 		.groupby(stock_ledger_entry.item_code, stock_ledger_entry.custom_batch, stock_ledger_entry.warehouse)
 	)
 
-	if not kwargs.get("for_stock_levels"):
-		query = query.where((batch_table.expiry_date >= today()) | (batch_table.expiry_date.isnull()))
-
 	if kwargs.get("posting_date"):
 		if kwargs.get("posting_time") is None:
 			kwargs.posting_time = nowtime()
@@ -91,14 +92,47 @@ def get_available_batches(kwargs):
 
 		query = query.where(timestamp_condition)
 
+	if kwargs.get("ignore_voucher_nos"):
+		query = query.where(stock_ledger_entry.voucher_no.notin(kwargs.get("ignore_voucher_nos")))
+
+	query = apply_batch_filters(query, stock_ledger_entry, batch_table, kwargs)
+	data = query.run(as_dict=True)
+
+	return data
+
+def get_available_batches_from_bin(kwargs):
+	bin = frappe.qb.DocType("Batch Manufacture Bin")
+	batch_table = frappe.qb.DocType("Batch Manufacture")
+
+	query = (
+		frappe.qb.from_(bin)
+		.inner_join(batch_table)
+		.on(bin.custom_batch == batch_table.name)
+		.select(
+			bin.custom_batch.as_("batch_manufacture"),
+			bin.warehouse,
+			bin.actual_qty.as_("qty"),
+		)
+		.where(batch_table.disabled == 0)
+	)
+
+	query = apply_batch_filters(query, bin, batch_table, kwargs)
+	data = query.run(as_dict=True)
+
+	return data
+
+def apply_batch_filters(query, table, batch_table, kwargs):
+	if not kwargs.get("for_stock_levels"):
+		query = query.where((batch_table.expiry_date >= today()) | (batch_table.expiry_date.isnull()))
+
 	for field in ["warehouse", "item_code"]:
 		if not kwargs.get(field):
 			continue
 
 		if isinstance(kwargs.get(field), list):
-			query = query.where(stock_ledger_entry[field].isin(kwargs.get(field)))
+			query = query.where(table[field].isin(kwargs.get(field)))
 		else:
-			query = query.where(stock_ledger_entry[field] == kwargs.get(field))
+			query = query.where(table[field] == kwargs.get(field))
 
 	if kwargs.get("batch_no"):
 		if isinstance(kwargs.batch_no, list):
@@ -113,9 +147,4 @@ def get_available_batches(kwargs):
 	else:
 		query = query.orderby(batch_table.creation)
 
-	if kwargs.get("ignore_voucher_nos"):
-		query = query.where(stock_ledger_entry.voucher_no.notin(kwargs.get("ignore_voucher_nos")))
-		
-	data = query.run(as_dict=True)
-
-	return data
\ No newline at end of file
+	return query
@@ -0,0 +1,84 @@
+# Copyright (c) 2025, DAS and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import IfNull, Sum
+from frappe.utils import flt
+
+
+class BatchManufactureBin(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Batch Manufacture Bin", ["item_code", "warehouse", "custom_batch"], constraint_name="unique_item_warehouse_batch"
+	)
+
+def get_batch_manufacture_bin(item_code, warehouse, custom_batch):
+	filters = {"item_code": item_code, "warehouse": warehouse, "custom_batch": custom_batch}
+
+	bin_name = frappe.db.get_value("Batch Manufacture Bin", filters)
+	if bin_name:
+		return bin_name
+
+	try:
+		bin_doc = frappe.get_doc({"doctype": "Batch Manufacture Bin", **filters})
+		bin_doc.flags.ignore_permissions = 1
+		bin_doc.insert()
+		return bin_doc.name
+	except frappe.UniqueValidationError:
+		# created by a concurrent transaction
+		return frappe.db.get_value("Batch Manufacture Bin", filters)
+
+def update_batch_manufacture_bin(item_code, warehouse, custom_batch, qty):
+	"""Add `qty` to the running balance of the (item, warehouse, batch) bin"""
+	if not custom_batch or not flt(qty):
+		return
+
+	bin_name = get_batch_manufacture_bin(item_code, warehouse, custom_batch)
+
+	bin = frappe.qb.DocType("Batch Manufacture Bin")
+	frappe.qb.update(bin).set(bin.actual_qty, bin.actual_qty + flt(qty)).where(bin.name == bin_name).run()
+
+def get_batch_manufacture_bin_qty(item_code, warehouse, custom_batch):
+	return flt(
+		frappe.db.get_value(
+			"Batch Manufacture Bin",
+			{"item_code": item_code, "warehouse": warehouse, "custom_batch": custom_batch},
+			"actual_qty",
+		)
+	)
+
+def rebuild_batch_manufacture_bin():
+	"""Recompute every bin from the Stock Ledger, used for the initial build and to repair drift"""
+	sle = frappe.qb.DocType("Stock Ledger Entry")
+
+	ledger = (
+		frappe.qb.from_(sle)
+		.select(sle.item_code, sle.warehouse, sle.custom_batch, Sum(sle.actual_qty).as_("actual_qty"))
+		.where((sle.is_cancelled == 0) & (IfNull(sle.custom_batch, "") != ""))
+		.groupby(sle.item_code, sle.warehouse, sle.custom_batch)
+	).run(as_dict=True)
+
+	bins = {
+		(d.item_code, d.warehouse, d.custom_batch): d
+		for d in frappe.get_all(
+			"Batch Manufacture Bin", fields=["name", "item_code", "warehouse", "custom_batch", "actual_qty"]
+		)
+	}
+
+	for row in ledger:
+		bin = bins.pop((row.item_code, row.warehouse, row.custom_batch), None)
+		if not bin:
+			bin = frappe._dict(
+				name=get_batch_manufacture_bin(row.item_code, row.warehouse, row.custom_batch), actual_qty=0
+			)
+
+		if flt(bin.actual_qty) != flt(row.actual_qty):
+			frappe.db.set_value("Batch Manufacture Bin", bin.name, "actual_qty", flt(row.actual_qty), update_modified=False)
+
+	# bins without any ledger entry left
+	for bin in bins.values():
+		if flt(bin.actual_qty):
+			frappe.db.set_value("Batch Manufacture Bin", bin.name, "actual_qty", 0, update_modified=False)
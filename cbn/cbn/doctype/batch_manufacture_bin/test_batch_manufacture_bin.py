@@ -0,0 +1,98 @@
+# Copyright (c) 2025, DAS and Contributors
+# See license.txt
+
+import frappe
+from frappe.query_builder.functions import IfNull, Sum
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+
+from cbn.cbn.doctype.batch_manufacture_bin.batch_manufacture_bin import (
+	get_batch_manufacture_bin_qty,
+	rebuild_batch_manufacture_bin,
+)
+
+WAREHOUSE = "_Test Warehouse - _TC"
+
+
+def make_batch_manufacture(batch_id, item_code):
+	if not frappe.db.exists("Batch Manufacture", batch_id):
+		frappe.get_doc({"doctype": "Batch Manufacture", "batch_id": batch_id, "item_code": item_code}).insert()
+
+	return batch_id
+
+
+def make_batch_entry(item_code, custom_batch, qty, target=None, source=None, posting_date=None):
+	"""Submitted receipt (target) or issue (source) of `qty` tagged with `custom_batch`"""
+	args = {"item_code": item_code, "qty": qty, "basic_rate": 100, "do_not_save": True}
+	if target:
+		args["target"] = target
+	if source:
+		args["source"] = source
+	if posting_date:
+		args["posting_date"] = posting_date
+
+	se = make_stock_entry(**args)
+	for row in se.items:
+		row.custom_batch = custom_batch
+
+	se.insert()
+	se.submit()
+	return se
+
+
+def get_ledger_qty(item_code, warehouse, custom_batch):
+	sle = frappe.qb.DocType("Stock Ledger Entry")
+	return flt(
+		(
+			frappe.qb.from_(sle)
+			.select(Sum(sle.actual_qty))
+			.where(
+				(sle.is_cancelled == 0)
+				& (sle.item_code == item_code)
+				& (sle.warehouse == warehouse)
+				& (IfNull(sle.custom_batch, "") == custom_batch)
+			)
+		).run()[0][0]
+	)
+
+
+class TestBatchManufactureBin(FrappeTestCase):
+	def setUp(self):
+		self.item_code = make_item("_Test Batch Manufacture Bin Item", {"is_stock_item": 1}).name
+		self.custom_batch = make_batch_manufacture("_Test BM Bin 001", self.item_code)
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def assertBinMatchesLedger(self):
+		self.assertEqual(
+			get_batch_manufacture_bin_qty(self.item_code, WAREHOUSE, self.custom_batch),
+			get_ledger_qty(self.item_code, WAREHOUSE, self.custom_batch),
+		)
+
+	def test_bin_follows_submit_and_cancel(self):
+		make_batch_entry(self.item_code, self.custom_batch, 10, target=WAREHOUSE)
+		issue = make_batch_entry(self.item_code, self.custom_batch, 4, source=WAREHOUSE)
+		self.assertEqual(get_batch_manufacture_bin_qty(self.item_code, WAREHOUSE, self.custom_batch), 6)
+		self.assertBinMatchesLedger()
+
+		issue.cancel()
+		self.assertEqual(get_batch_manufacture_bin_qty(self.item_code, WAREHOUSE, self.custom_batch), 10)
+		self.assertBinMatchesLedger()
+
+	def test_rebuild_repairs_drift(self):
+		make_batch_entry(self.item_code, self.custom_batch, 7, target=WAREHOUSE)
+
+		frappe.db.set_value(
+			"Batch Manufacture Bin",
+			{"item_code": self.item_code, "warehouse": WAREHOUSE, "custom_batch": self.custom_batch},
+			"actual_qty",
+			100,
+		)
+
+		rebuild_batch_manufacture_bin()
+		self.assertEqual(get_batch_manufacture_bin_qty(self.item_code, WAREHOUSE, self.custom_batch), 7)
+		self.assertBinMatchesLedger()
@@ -0,0 +1,126 @@
+# Copyright (c) 2025, DAS and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder import Case
+from frappe.query_builder.functions import IfNull, Sum
+from frappe.utils import add_days, flt, getdate, now, today
+
+
+class BatchManufactureDailySummary(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Batch Manufacture Daily Summary",
+		["item_code", "warehouse", "custom_batch", "posting_date"],
+		constraint_name="unique_item_warehouse_batch_date",
+	)
+	frappe.db.add_index("Batch Manufacture Daily Summary", ["company", "posting_date"])
+
+def get_rolled_upto():
+	rolled_upto = frappe.db.get_single_value("Batch Manufacture Settings", "summary_rolled_upto")
+	return getdate(rolled_upto) if rolled_upto else None
+
+def roll_daily_summary():
+	"""Daily job, fold every finished day after the last rolled date into the summary"""
+	rolled_upto = get_rolled_upto()
+	upto = getdate(add_days(today(), -1))
+	if rolled_upto and rolled_upto >= upto:
+		return
+
+	sle = frappe.qb.DocType("Stock Ledger Entry")
+
+	# in / out dihitung per voucher, sama seperti report
+	voucher_query = (
+		frappe.qb.from_(sle)
+		.select(
+			sle.item_code,
+			sle.warehouse,
+			sle.custom_batch,
+			sle.posting_date,
+			sle.company,
+			Sum(sle.actual_qty).as_("actual_qty"),
+		)
+		.where(
+			(sle.is_cancelled == 0)
+			& (IfNull(sle.custom_batch, "") != "")
+			& (sle.posting_date <= upto)
+		)
+		.groupby(sle.voucher_no, sle.item_code, sle.warehouse, sle.custom_batch)
+	)
+
+	if rolled_upto:
+		voucher_query = voucher_query.where(sle.posting_date > rolled_upto)
+
+	query = (
+		frappe.qb.from_(voucher_query)
+		.select(
+			voucher_query.item_code,
+			voucher_query.warehouse,
+			voucher_query.custom_batch,
+			voucher_query.posting_date,
+			voucher_query.company,
+			Sum(Case().when(voucher_query.actual_qty > 0, voucher_query.actual_qty).else_(0)).as_("in_qty"),
+			Sum(Case().when(voucher_query.actual_qty < 0, -voucher_query.actual_qty).else_(0)).as_("out_qty"),
+		)
+		.groupby(
+			voucher_query.item_code, voucher_query.warehouse, voucher_query.custom_batch, voucher_query.posting_date
+		)
+	)
+
+	timestamp = now()
+	frappe.db.bulk_insert(
+		"Batch Manufacture Daily Summary",
+		fields=[
+			"name", "creation", "modified", "owner", "modified_by",
+			"item_code", "warehouse", "custom_batch", "posting_date", "company", "in_qty", "out_qty",
+		],
+		values=[
+			(
+				frappe.generate_hash(length=10), timestamp, timestamp, "Administrator", "Administrator",
+				d.item_code, d.warehouse, d.custom_batch, d.posting_date, d.company, flt(d.in_qty), flt(d.out_qty),
+			)
+			for d in query.run(as_dict=True)
+		],
+	)
+
+	frappe.db.set_single_value("Batch Manufacture Settings", "summary_rolled_upto", upto)
+
+def update_daily_summary(sle):
+	"""Apply the net qty of a voucher posted on an already rolled day.
+	A cancellation comes in with the opposite sign, so it is taken back from the bucket the voucher went to."""
+	if not sle.custom_batch or not flt(sle.actual_qty):
+		return
+
+	rolled_upto = get_rolled_upto()
+	if not rolled_upto or getdate(sle.posting_date) > rolled_upto:
+		return
+
+	qty = flt(sle.actual_qty)
+	if sle.is_cancelled:
+		field, qty = ("in_qty", qty) if qty < 0 else ("out_qty", -qty)
+	else:
+		field, qty = ("in_qty", qty) if qty > 0 else ("out_qty", -qty)
+
+	filters = {
+		"item_code": sle.item_code,
+		"warehouse": sle.warehouse,
+		"custom_batch": sle.custom_batch,
+		"posting_date": getdate(sle.posting_date),
+	}
+
+	name = frappe.db.get_value("Batch Manufacture Daily Summary", filters)
+	if not name:
+		try:
+			doc = frappe.get_doc({"doctype": "Batch Manufacture Daily Summary", "company": sle.company, **filters})
+			doc.flags.ignore_permissions = 1
+			doc.insert()
+			name = doc.name
+		except frappe.UniqueValidationError:
+			# dibuat oleh transaksi lain
+			name = frappe.db.get_value("Batch Manufacture Daily Summary", filters)
+
+	summary = frappe.qb.DocType("Batch Manufacture Daily Summary")
+	frappe.qb.update(summary).set(summary[field], summary[field] + qty).where(summary.name == name).run()
@@ -0,0 +1,83 @@
+# Copyright (c) 2025, DAS and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, flt, getdate, today
+
+from erpnext.stock.doctype.item.test_item import make_item
+
+from cbn.cbn.doctype.batch_manufacture_bin.test_batch_manufacture_bin import (
+	WAREHOUSE,
+	make_batch_entry,
+	make_batch_manufacture,
+)
+from cbn.cbn.doctype.batch_manufacture_daily_summary.batch_manufacture_daily_summary import roll_daily_summary
+
+
+class TestBatchManufactureDailySummary(FrappeTestCase):
+	def setUp(self):
+		self.item_code = make_item("_Test Batch Manufacture Summary Item", {"is_stock_item": 1}).name
+		self.custom_batch = make_batch_manufacture("_Test BM Summary 001", self.item_code)
+		frappe.db.set_single_value("Batch Manufacture Settings", "summary_rolled_upto", add_days(today(), -10))
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def get_summary(self):
+		return {
+			getdate(d.posting_date): (flt(d.in_qty), flt(d.out_qty))
+			for d in frappe.get_all(
+				"Batch Manufacture Daily Summary",
+				filters={"item_code": self.item_code, "warehouse": WAREHOUSE, "custom_batch": self.custom_batch},
+				fields=["posting_date", "in_qty", "out_qty"],
+			)
+			if flt(d.in_qty) or flt(d.out_qty)
+		}
+
+	def get_ledger_summary(self):
+		"""in / out per day from the net qty of each voucher, the way the summary is rolled"""
+		vouchers = frappe.get_all(
+			"Stock Ledger Entry",
+			filters={
+				"item_code": self.item_code,
+				"warehouse": WAREHOUSE,
+				"custom_batch": self.custom_batch,
+				"is_cancelled": 0,
+				"posting_date": ("<", today()),
+			},
+			fields=["voucher_no", "posting_date", "sum(actual_qty) as qty"],
+			group_by="voucher_no, posting_date",
+		)
+
+		summary = {}
+		for d in vouchers:
+			in_qty, out_qty = summary.get(getdate(d.posting_date), (0.0, 0.0))
+			if flt(d.qty) > 0:
+				in_qty += flt(d.qty)
+			else:
+				out_qty -= flt(d.qty)
+
+			summary[getdate(d.posting_date)] = (in_qty, out_qty)
+
+		return {date: value for date, value in summary.items() if value[0] or value[1]}
+
+	def test_rolled_summary_matches_ledger(self):
+		make_batch_entry(self.item_code, self.custom_batch, 10, target=WAREHOUSE, posting_date=add_days(today(), -5))
+		make_batch_entry(self.item_code, self.custom_batch, 4, source=WAREHOUSE, posting_date=add_days(today(), -3))
+
+		roll_daily_summary()
+		self.assertEqual(self.get_summary(), self.get_ledger_summary())
+
+	def test_backdated_posting_and_cancel_after_roll(self):
+		receipt = make_batch_entry(self.item_code, self.custom_batch, 10, target=WAREHOUSE, posting_date=add_days(today(), -5))
+		roll_daily_summary()
+
+		# hari yang sudah di-roll diperbarui langsung saat submit / cancel
+		make_batch_entry(self.item_code, self.custom_batch, 6, target=WAREHOUSE, posting_date=add_days(today(), -4))
+		issue = make_batch_entry(self.item_code, self.custom_batch, 3, source=WAREHOUSE, posting_date=add_days(today(), -2))
+		self.assertEqual(self.get_summary(), self.get_ledger_summary())
+
+		issue.cancel()
+		receipt.cancel()
+		self.assertEqual(self.get_summary(), self.get_ledger_summary())
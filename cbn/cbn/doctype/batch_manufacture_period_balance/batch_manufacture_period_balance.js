@@ -0,0 +1,8 @@
+// Copyright (c) 2025, DAS and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Batch Manufacture Period Balance", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,140 @@
+# Copyright (c) 2025, DAS and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import IfNull, Max, Min, Sum
+from frappe.utils import add_days, add_months, flt, get_first_day, get_last_day, getdate, now, today
+
+
+class BatchManufacturePeriodBalance(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_index("Batch Manufacture Period Balance", ["company", "period_end"])
+
+def make_period_balances():
+	"""Daily job, close every finished month that has no balance yet
+	(new months and months removed by a backdated posting)"""
+	last_period_end = get_last_day(add_months(today(), -1))
+	for company in frappe.get_all("Company", pluck="name"):
+		make_company_period_balances(company, last_period_end)
+
+def make_company_period_balances(company, last_period_end):
+	# repost mengubah stock_value_difference, tunggu sampai selesai
+	if has_pending_reposts(company):
+		return
+
+	period_end = get_period_balance_date(company)
+	if period_end:
+		balances = {
+			(d.item_code, d.warehouse, d.custom_batch): [flt(d.qty), flt(d.stock_value)]
+			for d in frappe.get_all(
+				"Batch Manufacture Period Balance",
+				filters={"company": company, "period_end": period_end},
+				fields=["item_code", "warehouse", "custom_batch", "qty", "stock_value"],
+			)
+		}
+	else:
+		sle = frappe.qb.DocType("Stock Ledger Entry")
+		first_posting_date = (
+			frappe.qb.from_(sle)
+			.select(Min(sle.posting_date))
+			.where((sle.company == company) & (sle.is_cancelled == 0) & (IfNull(sle.custom_batch, "") != ""))
+		).run()[0][0]
+
+		if not first_posting_date:
+			return
+
+		period_end = add_days(get_first_day(first_posting_date), -1)
+		balances = {}
+
+	period_end = getdate(period_end)
+	while period_end < getdate(last_period_end):
+		next_period_end = getdate(get_last_day(add_days(period_end, 1)))
+
+		for d in get_ledger_balances(company, period_end, next_period_end):
+			balance = balances.setdefault((d.item_code, d.warehouse, d.custom_batch), [0.0, 0.0])
+			balance[0] += flt(d.qty)
+			balance[1] += flt(d.stock_value)
+
+		insert_period_balances(company, next_period_end, balances)
+		period_end = next_period_end
+
+def get_ledger_balances(company, from_date, to_date, filters=None):
+	"""Ledger movement per (item, warehouse, batch) posted after `from_date` up to `to_date`"""
+	sle = frappe.qb.DocType("Stock Ledger Entry")
+	query = (
+		frappe.qb.from_(sle)
+		.select(
+			sle.item_code,
+			sle.warehouse,
+			sle.custom_batch,
+			Sum(sle.actual_qty).as_("qty"),
+			Sum(sle.stock_value_difference).as_("stock_value"),
+		)
+		.where(
+			(sle.company == company)
+			& (sle.is_cancelled == 0)
+			& (sle.posting_date > from_date)
+			& (sle.posting_date <= to_date)
+			& (IfNull(sle.custom_batch, "") != "")
+		)
+		.groupby(sle.item_code, sle.warehouse, sle.custom_batch)
+	)
+
+	for field, value in (filters or {}).items():
+		if isinstance(value, (list, tuple)):
+			query = query.where(sle[field].isin(value))
+		else:
+			query = query.where(sle[field] == value)
+
+	return query.run(as_dict=True)
+
+def insert_period_balances(company, period_end, balances):
+	values = []
+	timestamp = now()
+	for (item_code, warehouse, custom_batch), (qty, stock_value) in balances.items():
+		if not flt(qty) and not flt(stock_value):
+			continue
+
+		values.append(
+			(
+				frappe.generate_hash(length=10), timestamp, timestamp, "Administrator", "Administrator",
+				period_end, company, item_code, warehouse, custom_batch, qty, stock_value,
+			)
+		)
+
+	frappe.db.bulk_insert(
+		"Batch Manufacture Period Balance",
+		fields=[
+			"name", "creation", "modified", "owner", "modified_by",
+			"period_end", "company", "item_code", "warehouse", "custom_batch", "qty", "stock_value",
+		],
+		values=values,
+	)
+
+def get_period_balance_date(company, before_date=None):
+	"""Latest closed period of the company, optionally the latest one ending before `before_date`"""
+	balance = frappe.qb.DocType("Batch Manufacture Period Balance")
+	query = frappe.qb.from_(balance).select(Max(balance.period_end)).where(balance.company == company)
+	if before_date:
+		query = query.where(balance.period_end < before_date)
+
+	return query.run()[0][0]
+
+def invalidate_period_balances(company, posting_date):
+	"""A posting on or before a closed period makes that period and the ones after it stale"""
+	filters = {"company": company, "period_end": (">=", posting_date)}
+	if frappe.db.exists("Batch Manufacture Period Balance", filters):
+		frappe.db.delete("Batch Manufacture Period Balance", filters)
+
+def invalidate_period_balances_for_repost(doc, method=None):
+	"""Repost Item Valuation rewrites the stock value of every entry from its posting date"""
+	invalidate_period_balances(doc.company, doc.posting_date)
+
+def has_pending_reposts(company):
+	return frappe.db.exists(
+		"Repost Item Valuation",
+		{"company": company, "docstatus": 1, "status": ("in", ["Queued", "In Progress"])},
+	)
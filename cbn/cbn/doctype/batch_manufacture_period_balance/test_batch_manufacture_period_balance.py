@@ -0,0 +1,107 @@
+# Copyright (c) 2025, DAS and Contributors
+# See license.txt
+
+import frappe
+from frappe.query_builder.functions import Sum
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, add_months, flt, get_first_day, get_last_day, today
+
+from erpnext.stock.doctype.item.test_item import make_item
+
+from cbn.cbn.doctype.batch_manufacture_bin.test_batch_manufacture_bin import (
+	WAREHOUSE,
+	make_batch_entry,
+	make_batch_manufacture,
+)
+from cbn.cbn.doctype.batch_manufacture_period_balance.batch_manufacture_period_balance import (
+	invalidate_period_balances_for_repost,
+	make_company_period_balances,
+)
+from cbn.cbn.report.batch_ledger.batch_ledger import get_opening_balance_from_batch
+
+COMPANY = "_Test Company"
+
+
+class TestBatchManufacturePeriodBalance(FrappeTestCase):
+	def setUp(self):
+		self.item_code = make_item("_Test Batch Manufacture Period Item", {"is_stock_item": 1}).name
+		self.custom_batch = make_batch_manufacture("_Test BM Period 001", self.item_code)
+		self.last_period_end = get_last_day(add_months(today(), -1))
+		self.first_date = add_days(get_first_day(add_months(today(), -3)), 4)
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def get_ledger_balance(self, upto):
+		sle = frappe.qb.DocType("Stock Ledger Entry")
+		qty, value = (
+			frappe.qb.from_(sle)
+			.select(Sum(sle.actual_qty), Sum(sle.stock_value_difference))
+			.where(
+				(sle.is_cancelled == 0)
+				& (sle.item_code == self.item_code)
+				& (sle.warehouse == WAREHOUSE)
+				& (sle.custom_batch == self.custom_batch)
+				& (sle.posting_date <= upto)
+			)
+		).run()[0]
+
+		return flt(qty), flt(value)
+
+	def get_period_balances(self):
+		return frappe.get_all(
+			"Batch Manufacture Period Balance",
+			filters={"company": COMPANY, "item_code": self.item_code, "custom_batch": self.custom_batch},
+			fields=["period_end", "qty", "stock_value"],
+			order_by="period_end",
+		)
+
+	def assertBalancesMatchLedger(self):
+		balances = self.get_period_balances()
+		self.assertTrue(balances)
+
+		for d in balances:
+			qty, value = self.get_ledger_balance(d.period_end)
+			self.assertEqual(flt(d.qty), qty)
+			self.assertEqual(flt(d.stock_value), value)
+
+	def assertOpeningMatchesLedger(self, from_date):
+		filters = frappe._dict(company=COMPANY, from_date=from_date, item_code=self.item_code, warehouse=WAREHOUSE)
+		opening = {
+			(d.item_code, d.custom_batch, d.warehouse): d
+			for d in get_opening_balance_from_batch(filters, None, [])
+		}.get((self.item_code, self.custom_batch, WAREHOUSE))
+
+		qty, value = self.get_ledger_balance(add_days(from_date, -1))
+		self.assertEqual(flt(opening.qty_after_transaction), qty)
+		self.assertEqual(flt(opening.stock_value), value)
+
+	def test_period_balances_match_ledger(self):
+		make_batch_entry(self.item_code, self.custom_batch, 10, target=WAREHOUSE, posting_date=self.first_date)
+		make_batch_entry(self.item_code, self.custom_batch, 3, source=WAREHOUSE, posting_date=add_months(self.first_date, 1))
+
+		make_company_period_balances(COMPANY, self.last_period_end)
+		self.assertBalancesMatchLedger()
+		self.assertOpeningMatchesLedger(add_days(self.last_period_end, 5))
+
+	def test_backdated_posting_invalidates_closed_periods(self):
+		make_batch_entry(self.item_code, self.custom_batch, 10, target=WAREHOUSE, posting_date=self.first_date)
+		make_company_period_balances(COMPANY, self.last_period_end)
+
+		posting_date = add_days(self.first_date, 1)
+		make_batch_entry(self.item_code, self.custom_batch, 5, target=WAREHOUSE, posting_date=posting_date)
+		self.assertFalse([d for d in self.get_period_balances() if str(d.period_end) >= str(posting_date)])
+
+		# saldo awal tetap benar dari ledger sebelum periode dibuat ulang
+		self.assertOpeningMatchesLedger(add_days(self.last_period_end, 5))
+
+		make_company_period_balances(COMPANY, self.last_period_end)
+		self.assertBalancesMatchLedger()
+
+	def test_repost_invalidates_closed_periods(self):
+		make_batch_entry(self.item_code, self.custom_batch, 10, target=WAREHOUSE, posting_date=self.first_date)
+		make_company_period_balances(COMPANY, self.last_period_end)
+		self.assertTrue(self.get_period_balances())
+
+		invalidate_period_balances_for_repost(frappe._dict(company=COMPANY, posting_date=self.first_date))
+		self.assertFalse(self.get_period_balances())
@@ -1,23 +1,128 @@
 # Copyright (c) 2025, DAS and contributors
 # For license information, please see license.txt
 
-import re
+import ast
+import operator
 
 import frappe
 from frappe.model.document import Document
 
+MAX_EXPONENT = 100
+
+def power(base, exponent):
+	# pangkat besar seperti 9 ** 9 ** 9 akan menahan worker
+	if abs(exponent) > MAX_EXPONENT:
+		raise ValueError(f"Exponent in formula is larger than {MAX_EXPONENT}")
+
+	return operator.pow(base, exponent)
+
+BINARY_OPERATORS = {
+	ast.Add: operator.add,
+	ast.Sub: operator.sub,
+	ast.Mult: operator.mul,
+	ast.Div: operator.truediv,
+	ast.FloorDiv: operator.floordiv,
+	ast.Pow: power,
+}
+UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+# (site, perintah produksi, modified) -> faktor hasil formula, dikosongkan bila penuh
+_formula_factors = {}
+FORMULA_CACHE_SIZE = 1024
+
+WAREHOUSE_CACHE = "cbn_perintah_produksi_warehouse"
+
 class PerintahProduksi(Document):
 	def validate(self):
 		self.validate_formula()
+
+	def on_update(self):
+		frappe.cache.delete_value(WAREHOUSE_CACHE)
+
+	def on_trash(self):
+		frappe.cache.delete_value(WAREHOUSE_CACHE)
 	
 	def validate_formula(self):
 		if not self.formula:
 			return
-		
-		if not re.fullmatch(r"[0-9+\-*/().\s]+", self.formula):
+
+		try:
+			tree = parse_formula(self.formula)
+		except (SyntaxError, ValueError):
 			frappe.throw("The formula contains invalid characters.")
 
 		try:
-			eval(self.formula, {"__builtins__": None}, {})
+			evaluate_formula(tree)
 		except Exception:
-			frappe.throw("The formula is not a valid mathematical expression.")
\ No newline at end of file
+			frappe.throw("The formula is not a valid mathematical expression.")
+
+def parse_formula(formula):
+	"""Parse `formula` into an expression tree of numbers, + - * / // ** and brackets only"""
+	tree = ast.parse(formula.strip(), mode="eval").body
+
+	for node in ast.walk(tree):
+		if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+			continue
+		if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+			continue
+		if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+			continue
+		if isinstance(node, ast.operator | ast.unaryop):
+			continue
+
+		raise ValueError(f"Unsupported element in formula: {type(node).__name__}")
+
+	return tree
+
+def evaluate_formula(node):
+	if isinstance(node, ast.Constant):
+		return node.value
+
+	if isinstance(node, ast.UnaryOp):
+		return UNARY_OPERATORS[type(node.op)](evaluate_formula(node.operand))
+
+	return BINARY_OPERATORS[type(node.op)](evaluate_formula(node.left), evaluate_formula(node.right))
+
+def get_formula_factor(perintah_produksi):
+	"""Multiplier from the Perintah Produksi formula, 1 when there is none.
+	The formula is parsed once per version of the document."""
+	if not perintah_produksi:
+		return 1
+
+	details = frappe.get_cached_value("Perintah Produksi", perintah_produksi, ["formula", "modified"], as_dict=1)
+	if not details or not details.formula:
+		return 1
+
+	key = (frappe.local.site, perintah_produksi, str(details.modified))
+	if key not in _formula_factors:
+		# versi lama tidak pernah dibaca lagi, cukup dibuang semua saat penuh
+		if len(_formula_factors) >= FORMULA_CACHE_SIZE:
+			_formula_factors.clear()
+
+		try:
+			_formula_factors[key] = evaluate_formula(parse_formula(details.formula))
+		except (SyntaxError, ValueError, ArithmeticError):
+			frappe.throw(
+				frappe._("Formula {0} of Perintah Produksi {1} is not a valid mathematical expression.").format(
+					frappe.bold(details.formula), frappe.bold(perintah_produksi)
+				)
+			)
+
+	return _formula_factors[key]
+
+def get_perintah_produksi_warehouses(company):
+	"""perintah produksi -> good / rejected warehouse of `company`, cached per company until a Perintah Produksi changes"""
+	warehouses = frappe.cache.hget(WAREHOUSE_CACHE, company)
+	if warehouses is None:
+		warehouses = {
+			d.parent: frappe._dict(good_warehouse=d.good_warehouse, rejected_warehouse=d.rejected_warehouse)
+			for d in frappe.get_all(
+				"Perintah Produksi Warehouse",
+				filters={"company": company, "parenttype": "Perintah Produksi"},
+				fields=["parent", "good_warehouse", "rejected_warehouse"],
+				order_by="idx desc",
+			)
+		}
+		frappe.cache.hset(WAREHOUSE_CACHE, company, warehouses)
+
+	return warehouses
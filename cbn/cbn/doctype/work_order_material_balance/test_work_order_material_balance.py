@@ -0,0 +1,151 @@
+# Copyright (c) 2025, DAS and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from erpnext.manufacturing.doctype.production_plan.test_production_plan import make_bom
+from erpnext.manufacturing.doctype.work_order.test_work_order import make_wo_order_test_record
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.serial_and_batch_bundle.test_serial_and_batch_bundle import (
+	get_batch_from_bundle,
+	get_serial_nos_from_bundle,
+)
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+
+from cbn.cbn.doctype.work_order_material_balance.work_order_material_balance import (
+	get_work_order_material_balance,
+	rebuild_work_order_material_balance,
+)
+
+COMPANY = "_Test Company"
+STORES = "Stores - _TC"
+WIP = "Work In Progress - _TC"
+
+
+def normalize(balance):
+	return {
+		key: (
+			flt(d.qty, 6),
+			{batch_no: flt(qty, 6) for batch_no, qty in d.batch_details.items() if flt(qty, 6)},
+			sorted(d.serial_nos),
+			d.perintah_produksi or "",
+		)
+		for key, d in balance.items()
+	}
+
+
+class TestWorkOrderMaterialBalance(FrappeTestCase):
+	def setUp(self):
+		frappe.db.set_single_value("Manufacturing Settings", "material_consumption", 1)
+
+		self.fg_item = make_item("_Test WOMB FG", {"is_stock_item": 1}).name
+		self.rm_item = make_item("_Test WOMB RM", {"is_stock_item": 1, "valuation_rate": 100}).name
+		self.batch_item = make_item(
+			"_Test WOMB Batch RM",
+			{
+				"is_stock_item": 1,
+				"has_batch_no": 1,
+				"create_new_batch": 1,
+				"batch_number_series": "TWOMB-.####",
+				"valuation_rate": 100,
+			},
+		).name
+		self.serial_item = make_item(
+			"_Test WOMB Serial RM",
+			{"is_stock_item": 1, "has_serial_no": 1, "serial_no_series": "TWOMBS-.####", "valuation_rate": 100},
+		).name
+
+		make_stock_entry(item_code=self.rm_item, target=STORES, qty=10, basic_rate=100)
+		receipt = make_stock_entry(item_code=self.batch_item, target=STORES, qty=10, basic_rate=100)
+		self.batch_no = get_batch_from_bundle(receipt.items[0].serial_and_batch_bundle)
+		receipt = make_stock_entry(item_code=self.serial_item, target=STORES, qty=5, basic_rate=100)
+		self.serial_nos = sorted(get_serial_nos_from_bundle(receipt.items[0].serial_and_batch_bundle))
+
+		bom = make_bom(
+			item=self.fg_item,
+			raw_materials=[self.rm_item, self.batch_item, self.serial_item],
+			rate=100,
+			company=COMPANY,
+		)
+		self.work_order = make_wo_order_test_record(
+			production_item=self.fg_item,
+			bom_no=bom.name,
+			qty=5,
+			company=COMPANY,
+			source_warehouse=STORES,
+			wip_warehouse=WIP,
+		).name
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def make_work_order_entry(self, purpose, rows):
+		se = frappe.new_doc("Stock Entry")
+		se.purpose = purpose
+		se.stock_entry_type = purpose
+		se.company = COMPANY
+		se.work_order = self.work_order
+		se.fg_completed_qty = 1
+		for row in rows:
+			se.append("items", {"conversion_factor": 1, "basic_rate": 100, "use_serial_batch_fields": 1, **row})
+
+		se.insert()
+		se.submit()
+		return se
+
+	def transfer(self, qty, serial_nos):
+		return self.make_work_order_entry(
+			"Material Transfer for Manufacture",
+			[
+				{"item_code": self.rm_item, "qty": qty, "s_warehouse": STORES, "t_warehouse": WIP},
+				{"item_code": self.batch_item, "qty": qty, "s_warehouse": STORES, "t_warehouse": WIP, "batch_no": self.batch_no},
+				{
+					"item_code": self.serial_item,
+					"qty": len(serial_nos),
+					"s_warehouse": STORES,
+					"t_warehouse": WIP,
+					"serial_no": "\n".join(serial_nos),
+				},
+			],
+		)
+
+	def consume(self, qty, serial_nos):
+		return self.make_work_order_entry(
+			"Material Consumption for Manufacture",
+			[
+				{"item_code": self.rm_item, "qty": qty, "s_warehouse": WIP},
+				{"item_code": self.batch_item, "qty": qty, "s_warehouse": WIP, "batch_no": self.batch_no},
+				{"item_code": self.serial_item, "qty": len(serial_nos), "s_warehouse": WIP, "serial_no": "\n".join(serial_nos)},
+			],
+		)
+
+	def assertBalanceMatchesRebuild(self):
+		stored = normalize(get_work_order_material_balance(self.work_order))
+		rebuild_work_order_material_balance(self.work_order)
+		self.assertEqual(stored, normalize(get_work_order_material_balance(self.work_order)))
+
+		return stored
+
+	def test_incremental_balance_matches_rebuild(self):
+		self.transfer(3, self.serial_nos[:3])
+		self.transfer(1, self.serial_nos[3:4])
+		consumption = self.consume(2, self.serial_nos[:1])
+
+		balance = self.assertBalanceMatchesRebuild()
+		self.assertEqual(balance[(self.rm_item, WIP)][0], 2)
+		self.assertEqual(balance[(self.batch_item, WIP)][1], {self.batch_no: 2})
+		self.assertEqual(balance[(self.serial_item, WIP)][2], self.serial_nos[1:4])
+
+		# cancel membangun ulang saldo, transfer setelahnya kembali incremental
+		consumption.cancel()
+		balance = self.assertBalanceMatchesRebuild()
+		self.assertEqual(balance[(self.rm_item, WIP)][0], 4)
+		self.assertEqual(balance[(self.batch_item, WIP)][1], {self.batch_no: 4})
+		self.assertEqual(balance[(self.serial_item, WIP)][2], self.serial_nos[:4])
+
+		self.transfer(1, self.serial_nos[4:5])
+		balance = self.assertBalanceMatchesRebuild()
+		self.assertEqual(balance[(self.rm_item, WIP)][0], 5)
+		self.assertEqual(balance[(self.serial_item, WIP)][2], self.serial_nos)
@@ -0,0 +1,8 @@
+// Copyright (c) 2025, DAS and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Work Order Material Balance", {
+// 	refresh(frm) {
+
+// 	},
+// });
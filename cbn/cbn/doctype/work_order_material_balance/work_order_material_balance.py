@@ -0,0 +1,125 @@
+# Copyright (c) 2025, DAS and contributors
+# For license information, please see license.txt
+
+import json
+from collections import defaultdict
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt
+
+from erpnext.stock.doctype.serial_no.serial_no import get_serial_nos
+
+MATERIAL_PURPOSES = ("Manufacture", "Material Consumption for Manufacture", "Material Transfer for Manufacture")
+
+# field baris stock entry yang dipakai lagi saat membuat baris backflush
+ITEM_DETAIL_FIELDS = (
+	"item_code",
+	"item_name",
+	"original_item",
+	"warehouse",
+	"s_warehouse",
+	"description",
+	"stock_uom",
+	"expense_account",
+	"cost_center",
+	"perintah_produksi",
+	"purpose",
+)
+
+
+class WorkOrderMaterialBalance(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Work Order Material Balance", ["work_order", "item_code", "warehouse"], constraint_name="unique_work_order_item_warehouse"
+	)
+
+def update_material_balance_from_stock_entry(doc, method=None):
+	if not doc.work_order or doc.purpose not in MATERIAL_PURPOSES:
+		return
+
+	# submit cukup menambahkan baris voucher ini, cancel menghitung ulang satu work order
+	if doc.docstatus == 1:
+		apply_stock_entry_to_material_balance(doc.work_order, doc.name)
+	else:
+		rebuild_work_order_material_balance(doc.work_order)
+
+def get_work_order_material_balance(work_order):
+	"""Available materials of the work order in the shape built by `get_available_materials`"""
+	available_materials = {}
+	for d in frappe.get_all(
+		"Work Order Material Balance",
+		filters={"work_order": work_order},
+		fields=["item_code", "warehouse", "qty", "perintah_produksi", "batch_details", "serial_nos", "item_details"],
+		order_by="creation, name",
+	):
+		available_materials[(d.item_code, d.warehouse)] = frappe._dict(
+			{
+				"item_details": frappe._dict(json.loads(d.item_details or "{}")),
+				"perintah_produksi": d.perintah_produksi or "",
+				"batch_details": defaultdict(float, json.loads(d.batch_details or "{}")),
+				"qty": flt(d.qty),
+				"serial_nos": get_serial_nos(d.serial_nos) if d.serial_nos else [],
+			}
+		)
+
+	return available_materials
+
+def apply_stock_entry_to_material_balance(work_order, voucher_no):
+	from cbn.overrides.stock_entry import apply_available_materials, get_material_key, get_stock_entry_data
+
+	lock_work_order(work_order)
+
+	data = get_stock_entry_data(work_order, voucher_no=voucher_no)
+	if not data:
+		return
+
+	available_materials = get_work_order_material_balance(work_order)
+	apply_available_materials(available_materials, data)
+	save_material_balance(work_order, available_materials, {get_material_key(row) for row in data})
+
+def rebuild_work_order_material_balance(work_order):
+	from cbn.overrides.stock_entry import apply_available_materials, get_stock_entry_data
+
+	lock_work_order(work_order)
+
+	available_materials = {}
+	apply_available_materials(available_materials, get_stock_entry_data(work_order))
+
+	frappe.db.delete("Work Order Material Balance", {"work_order": work_order})
+	save_material_balance(work_order, available_materials)
+
+def lock_work_order(work_order):
+	# dua stock entry untuk work order yang sama tidak boleh menimpa saldo satu sama lain
+	frappe.db.get_value("Work Order", work_order, "name", for_update=True)
+
+def save_material_balance(work_order, available_materials, keys=None):
+	existing = {
+		(d.item_code, d.warehouse): d.name
+		for d in frappe.get_all(
+			"Work Order Material Balance",
+			filters={"work_order": work_order},
+			fields=["name", "item_code", "warehouse"],
+		)
+	}
+
+	for key in keys or list(available_materials):
+		row = available_materials[key]
+		values = {
+			"qty": flt(row.qty),
+			"perintah_produksi": row.perintah_produksi or None,
+			"batch_details": frappe.as_json(row.batch_details),
+			"serial_nos": "\n".join(row.serial_nos),
+			"item_details": frappe.as_json({field: row.item_details.get(field) for field in ITEM_DETAIL_FIELDS}),
+		}
+
+		if key in existing:
+			frappe.db.set_value("Work Order Material Balance", existing[key], values)
+		else:
+			doc = frappe.get_doc(
+				{"doctype": "Work Order Material Balance", "work_order": work_order, "item_code": key[0], "warehouse": key[1], **values}
+			)
+			doc.flags.ignore_permissions = 1
+			doc.insert()
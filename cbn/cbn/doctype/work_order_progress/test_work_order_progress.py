@@ -0,0 +1,111 @@
+# Copyright (c) 2025, DAS and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_to_date, flt, getdate, now_datetime
+
+from erpnext.manufacturing.doctype.operation.test_operation import make_operation
+from erpnext.manufacturing.doctype.production_plan.test_production_plan import make_bom
+from erpnext.manufacturing.doctype.work_order.test_work_order import make_wo_order_test_record
+from erpnext.manufacturing.doctype.workstation.test_workstation import make_workstation
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+
+from cbn.cbn.report.work_order_progres.work_order_progres import execute
+
+COMPANY = "_Test Company"
+STORES = "Stores - _TC"
+FG_WAREHOUSE = "_Test Warehouse 1 - _TC"
+
+
+class TestWorkOrderProgress(FrappeTestCase):
+	def setUp(self):
+		self.fg_item = make_item("_Test WOP FG", {"is_stock_item": 1}).name
+		self.rm_item = make_item("_Test WOP RM", {"is_stock_item": 1, "valuation_rate": 100}).name
+		make_stock_entry(item_code=self.rm_item, target=STORES, qty=10, basic_rate=100)
+
+		workstation = make_workstation(workstation_name="_Test WOP Workstation", hour_rate=100).name
+		make_operation(operation="Filling", workstation=workstation)
+
+		bom = make_bom(
+			item=self.fg_item, raw_materials=[self.rm_item], rate=100, company=COMPANY, with_operations=1, do_not_save=True
+		)
+		bom.append("operations", {"operation": "Filling", "workstation": workstation, "time_in_mins": 60})
+		bom.insert()
+		bom.submit()
+
+		self.work_order = make_wo_order_test_record(
+			production_item=self.fg_item,
+			bom_no=bom.name,
+			qty=2,
+			company=COMPANY,
+			source_warehouse=STORES,
+			fg_warehouse=FG_WAREHOUSE,
+			skip_transfer=1,
+		).name
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def submit_job_card(self):
+		job_card = frappe.get_last_doc("Job Card", {"work_order": self.work_order, "operation": "Filling"})
+		job_card.append(
+			"time_logs",
+			{"from_time": now_datetime(), "to_time": add_to_date(now_datetime(), hours=1), "completed_qty": 2},
+		)
+		job_card.submit()
+		return job_card
+
+	def make_manufacture_entry(self):
+		se = frappe.new_doc("Stock Entry")
+		se.purpose = "Manufacture"
+		se.stock_entry_type = "Manufacture"
+		se.company = COMPANY
+		se.work_order = self.work_order
+		se.fg_completed_qty = 2
+		se.append("items", {"item_code": self.rm_item, "qty": 2, "s_warehouse": STORES, "conversion_factor": 1})
+		se.append(
+			"items",
+			{"item_code": self.fg_item, "qty": 2, "t_warehouse": FG_WAREHOUSE, "conversion_factor": 1, "is_finished_item": 1},
+		)
+		se.insert()
+		se.submit()
+		return se
+
+	def get_report_row(self):
+		_columns, data = execute(frappe._dict(company=COMPANY))
+		return next((row for row in data if row["work_order"] == self.work_order), None)
+
+	def assertProgressMatches(self, job_card, manufacture_entry=None):
+		job_card.reload()
+		row = self.get_report_row()
+		work_order = frappe.db.get_value("Work Order", self.work_order, ["custom_batch", "batch_size", "production_item"], as_dict=1)
+
+		self.assertEqual(row["production_item"], work_order.production_item)
+		self.assertEqual(row["batch"], work_order.custom_batch)
+		self.assertEqual(row["batch_size"], work_order.batch_size)
+		self.assertEqual(getdate(row["tgl_filling"]), getdate(job_card.actual_start_date))
+		self.assertEqual(flt(row["aktual_filling"]), flt(job_card.total_completed_qty))
+		self.assertEqual(row["tgl_kirim"] and getdate(row["tgl_kirim"]), manufacture_entry and getdate(manufacture_entry.posting_date))
+
+	def test_progress_follows_job_card_and_manufacture_entry(self):
+		self.assertIsNone(self.get_report_row())
+
+		job_card = self.submit_job_card()
+		self.assertEqual(frappe.db.get_value("Work Order Progress", self.work_order, "operations"), "Filling")
+		self.assertProgressMatches(job_card)
+
+		manufacture_entry = self.make_manufacture_entry()
+		self.assertProgressMatches(job_card, manufacture_entry)
+
+		# field work order dibaca langsung oleh report, tidak disalin ke progress
+		frappe.db.set_value("Work Order", self.work_order, "batch_size", 7)
+		self.assertProgressMatches(job_card, manufacture_entry)
+
+		manufacture_entry.cancel()
+		self.assertProgressMatches(job_card)
+
+		job_card.cancel()
+		self.assertFalse(frappe.db.exists("Work Order Progress", self.work_order))
+		self.assertIsNone(self.get_report_row())
@@ -0,0 +1,66 @@
+# Copyright (c) 2025, DAS and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+# operation job card -> field progress yang diisi dari (start date, completed qty, end date)
+OPERATION_FIELDS = {
+	"Timbang": {"tgl_timbang": "actual_start_date", "selesai_timbang": "actual_end_date"},
+	"Mixing": {"tgl_mixing": "actual_start_date"},
+	"Filling": {"tgl_filling": "actual_start_date", "aktual_filling": "total_completed_qty"},
+	"Coding": {"tgl_coding": "actual_start_date", "qty_coding": "total_completed_qty"},
+	"Packing": {"tgl_packing": "actual_start_date", "aktual_packing": "total_completed_qty"},
+}
+
+
+class WorkOrderProgress(Document):
+	pass
+
+def update_progress_from_job_card(doc, method=None):
+	if doc.work_order:
+		update_work_order_progress(doc.work_order)
+
+def update_progress_from_stock_entry(doc, method=None):
+	if doc.work_order and doc.purpose == "Manufacture":
+		update_work_order_progress(doc.work_order)
+
+def update_work_order_progress(work_order):
+	"""Rebuild the progress row of one work order from its submitted job cards and manufacture entries"""
+	job_cards = frappe.get_all(
+		"Job Card",
+		filters={"work_order": work_order, "docstatus": 1},
+		fields=["operation", "total_completed_qty", "actual_start_date", "actual_end_date"],
+		order_by="creation",
+	)
+
+	# sama seperti report sebelumnya, work order tanpa job card tidak ditampilkan
+	if not job_cards:
+		frappe.db.delete("Work Order Progress", {"work_order": work_order})
+		return
+
+	# data work order sendiri dibaca langsung oleh report, di sini hanya hasil job card dan manufacture
+	values = frappe._dict({field: None for fields in OPERATION_FIELDS.values() for field in fields})
+
+	operations = []
+	for jc in job_cards:
+		if jc.operation not in operations:
+			operations.append(jc.operation)
+
+		for field, jc_field in OPERATION_FIELDS.get(jc.operation, {}).items():
+			values[field] = jc[jc_field]
+
+	values.operations = "\n".join(operations)
+	values.tgl_kirim = frappe.db.get_value(
+		"Stock Entry",
+		{"work_order": work_order, "purpose": "Manufacture", "docstatus": 1},
+		"posting_date",
+		order_by="posting_date",
+	)
+
+	if frappe.db.exists("Work Order Progress", work_order):
+		frappe.db.set_value("Work Order Progress", work_order, values)
+	else:
+		doc = frappe.get_doc({"doctype": "Work Order Progress", "work_order": work_order, **values})
+		doc.flags.ignore_permissions = 1
+		doc.insert()
@@ -68,5 +68,97 @@ frappe.query_reports["Batch Ledger"] = {
 				};
 			},
 		},
-	]
+		{
+			fieldname: "paged",
+			label: __("Load Page by Page"),
+			fieldtype: "Check",
+			default: 0,
+		},
+	],
+
+	// sama dengan PAGE_LENGTH di batch_ledger.py
+	page_length: 500,
+
+	onload(report) {
+		report.batch_ledger_more_button = report.page.add_inner_button(__("Load More"), () =>
+			load_more_batch_ledger(report)
+		);
+		report.batch_ledger_more_button.toggle(false);
+
+		report.page.add_inner_button(__("Export All"), () => {
+			frappe.call({
+				method: "cbn.cbn.report.batch_ledger.batch_ledger.export_batch_ledger",
+				args: { filters: report.get_filter_values() },
+				callback: () => {
+					frappe.show_alert(__("Export started, you will be notified when the file is ready"));
+				},
+			});
+		});
+	},
+
+	after_datatable_render() {
+		// refresh atau filter baru memuat ulang halaman pertama, tombol mengikuti hasil baru
+		const report = frappe.query_report;
+		toggle_load_more_batch_ledger(report, has_more_batch_ledger(report, report.data || []));
+	},
 };
+
+function has_more_batch_ledger(report, data) {
+	// halaman pendek berarti ledger sudah habis
+	return (
+		!!report.get_filter_value("paged") &&
+		data.length >= report.report_settings.page_length &&
+		report.batch_ledger_loaded !== data
+	);
+}
+
+function toggle_load_more_batch_ledger(report, show) {
+	report.batch_ledger_more_button && report.batch_ledger_more_button.toggle(show);
+}
+
+// dengan filter "paged" report hanya memuat halaman pertama, halaman berikutnya diambil dengan cursor dari baris terakhir
+function load_more_batch_ledger(report) {
+	// report.data diganti setiap refresh, jadi penanda halaman terakhir ikut ter-reset
+	const data = report.data || [];
+	if (!has_more_batch_ledger(report, data)) {
+		toggle_load_more_batch_ledger(report, false);
+		frappe.show_alert(__("All rows are loaded"));
+		return;
+	}
+
+	// saldo terakhir per (item, batch, gudang) yang sudah tampil
+	const state = {};
+	data.forEach((row) => {
+		state[[row.item_code, row.custom_batch, row.warehouse].join("\n")] = [
+			row.item_code,
+			row.custom_batch,
+			row.warehouse,
+			row.qty_after_transaction,
+			row.stock_value,
+		];
+	});
+
+	const last = data[data.length - 1];
+	frappe.call({
+		method: "cbn.cbn.report.batch_ledger.batch_ledger.get_batch_ledger_page",
+		args: {
+			filters: report.get_filter_values(),
+			cursor: [last.date, last.creation, last.name],
+			state: Object.values(state),
+			page_length: report.report_settings.page_length,
+		},
+		freeze: true,
+		callback: (r) => {
+			const rows = r.message.data || [];
+			report.data = data.concat(rows);
+			if (rows.length) {
+				report.datatable.appendRows(rows);
+			}
+
+			if (!r.message.cursor) {
+				report.batch_ledger_loaded = report.data;
+				toggle_load_more_batch_ledger(report, false);
+			}
+		},
+	});
+}
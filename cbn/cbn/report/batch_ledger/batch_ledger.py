@@ -1,47 +1,152 @@
 # Copyright (c) 2024, DAS and contributors
 # For license information, please see license.txt
 
+import csv
+
 import frappe
 from frappe import _, _dict
-from frappe.query_builder.functions import CombineDatetime, IfNull, Sum
+from frappe.query_builder.functions import IfNull, Sum
 
 from erpnext.stock.doctype.warehouse.warehouse import apply_warehouse_filter
 from erpnext.stock.doctype.inventory_dimension.inventory_dimension import get_inventory_dimensions
 from erpnext.stock.utils import (
 	is_reposting_item_valuation_in_progress,
 )
-from frappe.utils.data import cint, flt
+from frappe.utils.data import add_days, cint, flt
+
+from cbn.cbn.doctype.batch_manufacture_period_balance.batch_manufacture_period_balance import (
+	get_period_balance_date,
+)
+
+PAGE_LENGTH = 500
 
 def execute(filters=None):
+	"""Full ledger, or only the first page when `paged` is set and the rest comes from `get_batch_ledger_page`"""
 	is_reposting_item_valuation_in_progress()
+
+	columns = get_columns(filters)
+	if filters.get("paged"):
+		data, _cursor = get_batch_ledger_data(filters, get_items(filters), None, {}, {}, PAGE_LENGTH)
+		return columns, data
+
 	data = []
-	include_uom = filters.get("include_uom")
+	for page in iter_batch_ledger(filters):
+		data.extend(page)
+
+	return columns, data
 
+@frappe.whitelist()
+def get_batch_ledger_page(filters, cursor=None, state=None, page_length=PAGE_LENGTH):
+	"""Satu halaman ledger setelah `cursor`.
+	`state` hanya berisi saldo batch yang sudah muncul di halaman sebelumnya, dikirim balik oleh client"""
+	check_report_permission()
+
+	filters = _dict(frappe.parse_json(filters))
+	cursor = frappe.parse_json(cursor) if cursor else None
+	state = {
+		tuple(d[:3]): _dict({"qty_after_transaction": flt(d[3]), "stock_value": flt(d[4])})
+		for d in frappe.parse_json(state or "[]")
+	}
+
+	data, cursor = get_batch_ledger_data(
+		filters, get_items(filters), cursor, state, {}, min(cint(page_length) or PAGE_LENGTH, 5000)
+	)
+
+	return {"data": data, "cursor": cursor}
+
+@frappe.whitelist()
+def export_batch_ledger(filters):
+	"""Full ledger as a CSV file, written page by page in a background job"""
+	check_report_permission()
+
+	frappe.enqueue(
+		"cbn.cbn.report.batch_ledger.batch_ledger.make_batch_ledger_export",
+		queue="long",
+		timeout=3600,
+		filters=filters,
+	)
+
+def make_batch_ledger_export(filters):
+	filters = _dict(frappe.parse_json(filters))
 	columns = get_columns(filters)
+
+	# tiap halaman langsung ditulis ke file, ledger lengkap tidak pernah ditahan di memori
+	file_name = "Batch Ledger {0}.csv".format(frappe.generate_hash(length=8))
+	with open(frappe.get_site_path("private", "files", file_name), "w", newline="") as f:
+		writer = csv.writer(f)
+		writer.writerow([column["label"] for column in columns])
+		for page in iter_batch_ledger(filters):
+			writer.writerows([row.get(column["fieldname"]) for column in columns] for row in page)
+
+	file = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": "/private/files/{0}".format(file_name),
+			"is_private": 1,
+		}
+	)
+	# nama file sudah unik, hash isi tidak perlu dihitung dengan membaca ulang seluruh file
+	file.flags.ignore_duplicate_entry_error = True
+	file.insert(ignore_permissions=True)
+
+	frappe.publish_realtime(
+		"msgprint",
+		_("Batch Ledger export is ready: {0}").format('<a href="{0}" target="_blank">{1}</a>'.format(file.file_url, file.file_name)),
+		user=frappe.session.user,
+	)
+
+def check_report_permission():
+	if not frappe.get_doc("Report", "Batch Ledger").is_permitted():
+		frappe.throw(_("You don't have access to Report: {0}").format(_("Batch Ledger")), frappe.PermissionError)
+
+def iter_batch_ledger(filters, page_length=PAGE_LENGTH):
+	"""Yield the ledger page by page, carrying the running balance per (item, batch, warehouse)"""
 	items = get_items(filters)
-	sl_entries = get_stock_ledger_entries(filters, items)
-	item_details = get_item_details(items, sl_entries, include_uom)
+	cursor, state, item_details = None, {}, {}
+
+	while True:
+		data, cursor = get_batch_ledger_data(filters, items, cursor, state, item_details, page_length)
+		if data:
+			yield data
+
+		if not cursor:
+			break
+
+def get_batch_ledger_data(filters, items, cursor, state, item_details, page_length):
+	sl_entries = get_stock_ledger_entries(filters, items, after=cursor, limit=page_length)
+	if not sl_entries:
+		return [], None
 
-	opening_row = get_opening_balance_from_batch(filters, columns, sl_entries)
 	precision = cint(frappe.db.get_single_value("System Settings", "float_precision"))
-	
-	item_list = {}
-	for row in opening_row:
-		key = tuple([row.item_code, row.custom_batch, row.warehouse])
-		item_list.setdefault(key, _dict({
-			"qty_after_transaction": row.qty_after_transaction,
-			"stock_value": row.stock_value
-		}))
 
+	# saldo awal hanya diambil untuk batch yang baru muncul di halaman ini
+	new_entries = [sle for sle in sl_entries if (sle.item_code, sle.custom_batch, sle.warehouse) not in state]
+	if new_entries:
+		# gudang lain dari batch yang sama tidak disimpan, saldonya diambil saat baris itu muncul
+		new_keys = {(sle.item_code, sle.custom_batch, sle.warehouse) for sle in new_entries}
+		for row in get_opening_balance_from_batch(filters, None, new_entries):
+			if (row.item_code, row.custom_batch, row.warehouse) not in new_keys:
+				continue
+
+			state.setdefault((row.item_code, row.custom_batch, row.warehouse), _dict({
+				"qty_after_transaction": flt(row.qty_after_transaction),
+				"stock_value": flt(row.stock_value)
+			}))
+
+	if missing_items := list({sle.item_code for sle in sl_entries if sle.item_code not in item_details}):
+		item_details.update(get_item_details(missing_items, sl_entries, filters.get("include_uom")))
+
+	data = []
 	for sle in sl_entries:
 		item_detail = item_details[sle.item_code]
 
 		sle.update(item_detail)
 		
 		key = tuple([sle.item_code, sle.custom_batch, sle.warehouse])
-		item = item_list.get(key)
+		item = state.get(key)
 		if not item:
-			item = item_list.setdefault(key, _dict({
+			item = state.setdefault(key, _dict({
 				"qty_after_transaction": 0,
 				"stock_value": 0
 			}))
@@ -60,7 +165,12 @@ def execute(filters=None):
 			
 		data.append(sle)
 
-	return columns, data
+	cursor = None
+	if len(sl_entries) == page_length:
+		last = sl_entries[-1]
+		cursor = [str(last.date), str(last.creation), last.name]
+
+	return data, cursor
 
 def get_columns(filters):
 	columns = [
@@ -175,7 +285,7 @@ def get_columns(filters):
 def get_inventory_dimension_fields():
 	return [dimension.fieldname for dimension in get_inventory_dimensions()]
 
-def get_stock_ledger_entries(filters, items):
+def get_stock_ledger_entries(filters, items, after=None, limit=None):
 	sle = frappe.qb.DocType("Stock Ledger Entry")
 	query = (
 		frappe.qb.from_(sle)
@@ -195,16 +305,33 @@ def get_stock_ledger_entries(filters, items):
 			sle.stock_value,
 			sle.custom_batch,
 			sle.project,
+			sle.creation,
+			sle.name,
 		)
 		.where(
 			(sle.docstatus < 2)
 			& (sle.is_cancelled == 0)
 			& (sle.posting_date[filters.from_date : filters.to_date])
 		)
-		.orderby(CombineDatetime(sle.posting_date, sle.posting_time))
+		.orderby(sle.posting_datetime)
 		.orderby(sle.creation)
+		.orderby(sle.name)
 	)
 
+	if after:
+		# keyset pagination, lanjut setelah baris terakhir halaman sebelumnya
+		posting_datetime, creation, name = after
+		query = query.where(
+			(sle.posting_datetime > posting_datetime)
+			| (
+				(sle.posting_datetime == posting_datetime)
+				& ((sle.creation > creation) | ((sle.creation == creation) & (sle.name > name)))
+			)
+		)
+
+	if limit:
+		query = query.limit(limit)
+
 	inventory_dimension_fields = get_inventory_dimension_fields()
 	if inventory_dimension_fields:
 		for fieldname in inventory_dimension_fields:
@@ -241,9 +368,6 @@ def get_stock_ledger_entries(filters, items):
 def get_opening_balance_from_batch(filters, columns, sl_entries):
 	query_filters = {
 		"custom_batch": filters.batch or ["is", "set"],
-		"docstatus": 1,
-		"is_cancelled": 0,
-		"posting_date": ("<", filters.from_date),
 		"company": filters.company,
 	}
 
@@ -251,6 +375,13 @@ def get_opening_balance_from_batch(filters, columns, sl_entries):
 		if filters.get(fields):
 			query_filters[fields] = filters.get(fields)
 
+	if sl_entries and not filters.get("item_code"):
+		query_filters["item_code"] = ("in", list({sle.item_code for sle in sl_entries}))
+
+	# hanya batch yang ada di halaman ini, bukan semua batch dari item-itemnya
+	if sl_entries and not filters.batch:
+		query_filters["custom_batch"] = ("in", list({sle.custom_batch for sle in sl_entries}))
+
 	if filters.warehouse_type and not filters.warehouse:
 		warehouses = frappe.get_all(
 			"Warehouse",
@@ -261,12 +392,49 @@ def get_opening_balance_from_batch(filters, columns, sl_entries):
 		if warehouses:
 			query_filters["warehouse"] = ("in", warehouses)
 
-	return frappe.get_all(
+	# mulai dari saldo penutupan bulan terakhir, sisanya dihitung dari ledger
+	period_end = get_period_balance_date(filters.company, before_date=filters.from_date)
+	if not period_end:
+		return frappe.get_all(
+			"Stock Ledger Entry",
+			fields=["item_code", "custom_batch", "warehouse","sum(actual_qty) as qty_after_transaction", "sum(stock_value_difference) as stock_value"],
+			filters={
+				**query_filters,
+				"docstatus": 1,
+				"is_cancelled": 0,
+				"posting_date": ("<", filters.from_date),
+			},
+			group_by="item_code, custom_batch, warehouse"
+		)
+
+	opening = {}
+	for row in frappe.get_all(
+		"Batch Manufacture Period Balance",
+		fields=["item_code", "custom_batch", "warehouse", "qty as qty_after_transaction", "stock_value"],
+		filters={**query_filters, "period_end": period_end},
+	):
+		opening[(row.item_code, row.custom_batch, row.warehouse)] = row
+
+	for row in frappe.get_all(
 		"Stock Ledger Entry",
 		fields=["item_code", "custom_batch", "warehouse","sum(actual_qty) as qty_after_transaction", "sum(stock_value_difference) as stock_value"],
-		filters=query_filters,
+		filters={
+			**query_filters,
+			"docstatus": 1,
+			"is_cancelled": 0,
+			"posting_date": ("between", [add_days(period_end, 1), add_days(filters.from_date, -1)]),
+		},
 		group_by="item_code, custom_batch, warehouse"
-	)
+	):
+		key = (row.item_code, row.custom_batch, row.warehouse)
+		if key not in opening:
+			opening[key] = row
+			continue
+
+		opening[key].qty_after_transaction += flt(row.qty_after_transaction)
+		opening[key].stock_value += flt(row.stock_value)
+
+	return list(opening.values())
 
 def get_item_details(items, sl_entries, include_uom):
 	item_details = {}
@@ -77,6 +77,12 @@ frappe.query_reports["Stock Batch Balance"] = {
 				};
 			},
 		},
+		{
+			fieldname: "show_draft_entries",
+			label: __("Show Draft Stock Entry"),
+			fieldtype: "Check",
+			default: 1,
+		},
 	],
 	formatter: function (value, row, column, data, default_formatter) {
 		if (column.fieldname == "Batch" && data && !!data["Batch"]) {
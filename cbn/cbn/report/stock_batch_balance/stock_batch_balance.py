@@ -4,13 +4,15 @@
 
 import frappe
 from frappe import _
-from frappe.query_builder.functions import IfNull
+from frappe.query_builder import Case
 from frappe.utils import add_to_date, cint, flt, get_datetime, get_table_name, getdate
 from frappe.utils.deprecations import deprecated
 from pypika import functions as fn
 
 from erpnext.stock.doctype.warehouse.warehouse import apply_warehouse_filter
 
+from cbn.cbn.report.utils import get_item_details
+
 SLE_COUNT_LIMIT = 10_000
 
 
@@ -47,10 +49,13 @@ def execute(filters=None):
 	float_precision = cint(frappe.db.get_default("float_precision")) or 3
 
 	columns = get_columns(filters)
-	item_map = get_item_details(filters)
 	iwb_map = get_item_warehouse_batch_map(filters, float_precision)
 
-	get_ste_draft(iwb_map, float_precision)
+	if cint(filters.get("show_draft_entries", 1)):
+		get_ste_draft(iwb_map, float_precision, filters)
+
+	item_map = get_item_details(iwb_map)
+
 	data = []
 	for item in sorted(iwb_map):
 		if not filters.get("item") or filters.get("item") == item:
@@ -99,11 +104,22 @@ def get_columns(filters):
 
 	return columns
 
-def get_ste_draft(iwb_map, float_precision):
+def get_ste_draft(iwb_map, float_precision, filters):
+	"""Overlay draft Stock Entry qty, limited to the report filters and the batches already in the result"""
+	batches = {batch for item in iwb_map.values() for wh in item.values() for batch in wh}
+	if filters.get("batch_no"):
+		batches &= {filters.batch_no}
+
+	if not batches:
+		return
+
 	sted = frappe.qb.DocType("Stock Entry Detail")
+	ste = frappe.qb.DocType("Stock Entry")
 	
 	query = (
 		frappe.qb.from_(sted)
+		.inner_join(ste)
+		.on(ste.name == sted.parent)
 		.select(
 			sted.item_code,
 			sted.batch_no,
@@ -113,15 +129,26 @@ def get_ste_draft(iwb_map, float_precision):
 			fn.Sum(sted.qty).as_("actual_qty"),
 		)
 		.where(
-			(sted.docstatus < 1)
-			& (IfNull(sted.batch_no, "") != "")
+			(sted.docstatus == 0)
+			& (sted.batch_no.isin(list(batches)))
+			& (ste.posting_date <= filters.to_date)
 		)
 		.groupby(sted.batch_no, sted.parent)
-	).run(as_dict=True)
+	)
+
+	if filters.get("company"):
+		query = query.where(ste.company == filters.company)
+
+	if filters.get("item_code"):
+		query = query.where(sted.item_code == filters.item_code)
 
-	for d in query:
+	warehouses = get_filtered_warehouses(filters)
+	if warehouses is not None:
+		query = query.where(sted.s_warehouse.isin(warehouses) | sted.t_warehouse.isin(warehouses))
+
+	for d in query.run(as_dict=True):
 		item_map = iwb_map.setdefault(d.item_code, {})
-		if d.s_warehouse:
+		if d.s_warehouse and (warehouses is None or d.s_warehouse in warehouses):
 			qty_dict = item_map.setdefault(d.s_warehouse, {}).setdefault(
 				d.batch_no, default_qty_dict()
 			)
@@ -130,7 +157,7 @@ def get_ste_draft(iwb_map, float_precision):
 
 			qty_dict.ste_link.append(d.parent)
 
-		if d.t_warehouse:
+		if d.t_warehouse and (warehouses is None or d.t_warehouse in warehouses):
 			qty_dict = item_map.setdefault(d.t_warehouse, {}).setdefault(
 				d.batch_no, default_qty_dict()
 			)
@@ -140,6 +167,24 @@ def get_ste_draft(iwb_map, float_precision):
 
 			qty_dict.ste_link.append(d.parent)
 
+def get_filtered_warehouses(filters):
+	"""Leaf warehouses matching the warehouse / warehouse type filter, None when neither is set"""
+	if filters.get("warehouse"):
+		warehouse = frappe.db.get_value("Warehouse", filters.warehouse, ["lft", "rgt"], as_dict=1)
+		if not warehouse:
+			frappe.throw(_("Warehouse {0} does not exist").format(frappe.bold(filters.warehouse)))
+
+		return frappe.get_all(
+			"Warehouse", filters={"lft": (">=", warehouse.lft), "rgt": ("<=", warehouse.rgt), "is_group": 0}, pluck="name"
+		) or [filters.warehouse]
+
+	if filters.get("warehouse_type"):
+		return frappe.get_all(
+			"Warehouse",
+			filters={"warehouse_type": filters.warehouse_type, "is_group": 0},
+			pluck="name",
+		) or None
+
 def default_qty_dict():
 	return frappe._dict({
 		"opening_qty": 0.0, "in_qty": 0.0, "out_qty": 0.0, "bal_qty": 0.0, "ste_qty": 0.0, "net_qty": 0.0, 
@@ -179,7 +224,6 @@ def get_stock_ledger_entries_for_batch_no(filters):
 			& (sle.posting_datetime < posting_datetime)
 		)
 		.groupby(sle.voucher_no, sle.batch_no, sle.item_code, sle.warehouse)
-		.orderby(sle.item_code, sle.warehouse)
 	)
 
 	query = apply_warehouse_filter(query, sle, filters)
@@ -197,7 +241,7 @@ def get_stock_ledger_entries_for_batch_no(filters):
 		if filters.get(field):
 			query = query.where(sle[field] == filters.get(field))
 
-	return query.run(as_dict=True) or []
+	return get_batch_balance(query, filters)
 
 
 def get_stock_ledger_entries_for_batch_bundle(filters):
@@ -222,7 +266,6 @@ def get_stock_ledger_entries_for_batch_bundle(filters):
 			& (sle.posting_date <= filters["to_date"])
 		)
 		.groupby(sle.voucher_no, batch_package.batch_no, batch_package.warehouse)
-		.orderby(sle.item_code, sle.warehouse)
 	)
 
 	query = apply_warehouse_filter(query, sle, filters)
@@ -243,41 +286,48 @@ def get_stock_ledger_entries_for_batch_bundle(filters):
 			else:
 				query = query.where(sle[field] == filters.get(field))
 
+	return get_batch_balance(query, filters)
+
+
+def get_batch_balance(voucher_query, filters):
+	"""Fold the per-voucher movement into opening/in/out/balance per (item, warehouse, batch).
+	A voucher counts as in or out by its net qty, like the old per-row loop."""
+	from_date = getdate(filters["from_date"])
+	in_period = voucher_query.posting_date >= from_date
+
+	query = (
+		frappe.qb.from_(voucher_query)
+		.select(
+			voucher_query.item_code,
+			voucher_query.warehouse,
+			voucher_query.batch_no,
+			fn.Sum(
+				Case().when(voucher_query.posting_date < from_date, voucher_query.actual_qty).else_(0)
+			).as_("opening_qty"),
+			fn.Sum(
+				Case().when(in_period & (voucher_query.actual_qty > 0), voucher_query.actual_qty).else_(0)
+			).as_("in_qty"),
+			fn.Sum(
+				Case().when(in_period & (voucher_query.actual_qty < 0), -voucher_query.actual_qty).else_(0)
+			).as_("out_qty"),
+			fn.Sum(voucher_query.actual_qty).as_("bal_qty"),
+		)
+		.groupby(voucher_query.item_code, voucher_query.warehouse, voucher_query.batch_no)
+	)
+
 	return query.run(as_dict=True) or []
 
 
 def get_item_warehouse_batch_map(filters, float_precision):
-	sle = get_stock_ledger_entries(filters)
 	iwb_map = {}
 
-	from_date = getdate(filters["from_date"])
-	to_date = getdate(filters["to_date"])
-
-	for d in sle:
-		iwb_map.setdefault(d.item_code, {}).setdefault(d.warehouse, {}).setdefault(
+	for d in get_stock_ledger_entries(filters):
+		qty_dict = iwb_map.setdefault(d.item_code, {}).setdefault(d.warehouse, {}).setdefault(
 			d.batch_no, default_qty_dict()
 		)
-		qty_dict = iwb_map[d.item_code][d.warehouse][d.batch_no]
-		if d.posting_date < from_date:
-			qty_dict.opening_qty = flt(qty_dict.opening_qty, float_precision) + flt(
-				d.actual_qty, float_precision
-			)
-		elif d.posting_date >= from_date and d.posting_date <= to_date:
-			if flt(d.actual_qty) > 0:
-				qty_dict.in_qty = flt(qty_dict.in_qty, float_precision) + flt(d.actual_qty, float_precision)
-			else:
-				qty_dict.out_qty = flt(qty_dict.out_qty, float_precision) + abs(
-					flt(d.actual_qty, float_precision)
-				)
 
-		qty_dict.bal_qty = flt(qty_dict.bal_qty, float_precision) + flt(d.actual_qty, float_precision)
+		# batch_no dan bundle bisa menghasilkan key yang sama
+		for field in ("opening_qty", "in_qty", "out_qty", "bal_qty"):
+			qty_dict[field] = flt(qty_dict[field] + flt(d[field]), float_precision)
 
 	return iwb_map
-
-
-def get_item_details(filters):
-	item_map = {}
-	for d in (frappe.qb.from_("Item").select("name", "item_name", "description", "stock_uom")).run(as_dict=1):
-		item_map.setdefault(d.name, d)
-
-	return item_map
@@ -4,50 +4,29 @@
 
 import frappe
 from frappe import _
-from frappe.utils import add_to_date, cint, flt, get_datetime, get_table_name, getdate
+from frappe.query_builder import Case
+from frappe.utils import add_to_date, cint, flt, get_datetime, getdate
 from frappe.utils.deprecations import deprecated
 from pypika import functions as fn
 
 from erpnext.stock.doctype.warehouse.warehouse import apply_warehouse_filter
 
-SLE_COUNT_LIMIT = 10_000
-
-
-def _estimate_table_row_count(doctype: str):
-	table = get_table_name(doctype)
-	return cint(
-		frappe.db.sql(
-			f"""select table_rows
-			   from  information_schema.tables
-			   where table_name = '{table}' ;"""
-		)[0][0]
-	)
+from cbn.cbn.doctype.batch_manufacture_daily_summary.batch_manufacture_daily_summary import get_rolled_upto
+from cbn.cbn.report.utils import get_item_details
 
 
 def execute(filters=None):
 	if not filters:
 		filters = {}
 
-	sle_count = _estimate_table_row_count("Stock Ledger Entry")
-
-	if (
-		sle_count > SLE_COUNT_LIMIT
-		and not filters.get("item_code")
-		and not filters.get("warehouse")
-		and not filters.get("warehouse_type")
-	):
-		frappe.throw(
-			_("Please select either the Item or Warehouse or Warehouse Type filter to generate the report.")
-		)
-
 	if filters.from_date > filters.to_date:
 		frappe.throw(_("From Date must be before To Date"))
 
 	float_precision = cint(frappe.db.get_default("float_precision")) or 3
 
 	columns = get_columns(filters)
-	item_map = get_item_details(filters)
 	iwb_map = get_item_warehouse_batch_map(filters, float_precision)
+	item_map = get_item_details(iwb_map)
 
 	data = []
 	for item in sorted(iwb_map):
@@ -95,8 +74,8 @@ def get_columns(filters):
 	return columns
 
 
-def get_stock_ledger_entries(filters):
-	entries = get_stock_ledger_entries_for_batch_no(filters)
+def get_stock_ledger_entries(filters, after_date=None):
+	entries = get_stock_ledger_entries_for_batch_no(filters, after_date)
 	# entries += get_stock_ledger_entries_for_batch_bundle(filters)
 
 	# batch_and_bundle = get_stock_ledger_entries_for_batch_bundle(filters)
@@ -105,7 +84,7 @@ def get_stock_ledger_entries(filters):
 
 
 @deprecated
-def get_stock_ledger_entries_for_batch_no(filters):
+def get_stock_ledger_entries_for_batch_no(filters, after_date=None):
 	if not filters.get("from_date"):
 		frappe.throw(_("'From Date' is required"))
 	if not filters.get("to_date"):
@@ -138,6 +117,10 @@ def get_stock_ledger_entries_for_batch_no(filters):
 		.orderby(sle.item_code, sle.warehouse)
 	)
 
+	if after_date:
+		# hari yang sudah masuk summary tidak dibaca lagi dari ledger
+		query = query.where(sle.posting_date > after_date)
+
 	query = apply_warehouse_filter(query, sle, filters)
 	if filters.warehouse_type and not filters.warehouse:
 		warehouses = frappe.get_all(
@@ -206,13 +189,69 @@ def get_stock_ledger_entries_for_batch_bundle(filters):
 	return query.run(as_dict=True) or []
 
 
+def get_summary_entries(filters, rolled_upto):
+	"""Opening/in/out per (item, warehouse, batch) from the daily summary, up to the last rolled day"""
+	summary = frappe.qb.DocType("Batch Manufacture Daily Summary")
+	batch_manufacture = frappe.qb.DocType("Batch Manufacture")
+
+	from_date = getdate(filters["from_date"])
+	before_period = summary.posting_date < from_date
+
+	query = (
+		frappe.qb.from_(summary)
+		.inner_join(batch_manufacture)
+		.on(batch_manufacture.name == summary.custom_batch)
+		.select(
+			summary.item_code,
+			summary.warehouse,
+			summary.custom_batch,
+			batch_manufacture.expiry_date,
+			fn.Sum(Case().when(before_period, summary.in_qty - summary.out_qty).else_(0)).as_("opening_qty"),
+			fn.Sum(Case().when(before_period, 0).else_(summary.in_qty)).as_("in_qty"),
+			fn.Sum(Case().when(before_period, 0).else_(summary.out_qty)).as_("out_qty"),
+		)
+		.where(summary.posting_date <= min(getdate(filters["to_date"]), rolled_upto))
+		.groupby(summary.item_code, summary.warehouse, summary.custom_batch)
+	)
+
+	query = apply_warehouse_filter(query, summary, filters)
+	if filters.warehouse_type and not filters.warehouse:
+		warehouses = frappe.get_all(
+			"Warehouse",
+			filters={"warehouse_type": filters.warehouse_type, "is_group": 0},
+			pluck="name",
+		)
+
+		if warehouses:
+			query = query.where(summary.warehouse.isin(warehouses))
+
+	for field in ["item_code", "custom_batch", "company"]:
+		if filters.get(field):
+			query = query.where(summary[field] == filters.get(field))
+
+	return query.run(as_dict=True) or []
+
+
 def get_item_warehouse_batch_map(filters, float_precision):
-	sle = get_stock_ledger_entries(filters)
 	iwb_map = {}
 
 	from_date = getdate(filters["from_date"])
 	to_date = getdate(filters["to_date"])
 
+	rolled_upto = get_rolled_upto()
+	if rolled_upto:
+		for d in get_summary_entries(filters, rolled_upto):
+			qty_dict = iwb_map.setdefault(d.item_code, {}).setdefault(d.warehouse, {}).setdefault(
+				d.custom_batch, frappe._dict({"opening_qty": 0.0, "in_qty": 0.0, "out_qty": 0.0, "bal_qty": 0.0, "expiry_date": d.expiry_date})
+			)
+			qty_dict.opening_qty = flt(d.opening_qty, float_precision)
+			qty_dict.in_qty = flt(d.in_qty, float_precision)
+			qty_dict.out_qty = flt(d.out_qty, float_precision)
+			qty_dict.bal_qty = flt(qty_dict.opening_qty + qty_dict.in_qty - qty_dict.out_qty, float_precision)
+
+	# sisa hari yang belum di-roll dibaca langsung dari ledger
+	sle = get_stock_ledger_entries(filters, after_date=rolled_upto)
+
 	for d in sle:
 		iwb_map.setdefault(d.item_code, {}).setdefault(d.warehouse, {}).setdefault(
 			d.custom_batch, frappe._dict({"opening_qty": 0.0, "in_qty": 0.0, "out_qty": 0.0, "bal_qty": 0.0, "expiry_date": d.expiry_date})
@@ -233,11 +272,3 @@ def get_item_warehouse_batch_map(filters, float_precision):
 		qty_dict.bal_qty = flt(qty_dict.bal_qty, float_precision) + flt(d.actual_qty, float_precision)
 
 	return iwb_map
-
-
-def get_item_details(filters):
-	item_map = {}
-	for d in (frappe.qb.from_("Item").select("name", "item_name", "description", "stock_uom")).run(as_dict=1):
-		item_map.setdefault(d.name, d)
-
-	return item_map
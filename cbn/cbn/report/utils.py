@@ -0,0 +1,27 @@
+# Copyright (c) 2025, DAS and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import create_batch
+
+ITEM_CHUNK_SIZE = 1000
+
+
+def get_item_details(item_codes):
+	"""Item name, description and stock uom for `item_codes` only, cached for the current request"""
+	if frappe.flags.report_item_details is None:
+		frappe.flags.report_item_details = {}
+
+	item_map = frappe.flags.report_item_details
+	missing = [d for d in set(item_codes) if d not in item_map]
+
+	item = frappe.qb.DocType("Item")
+	for chunk in create_batch(missing, ITEM_CHUNK_SIZE):
+		for d in (
+			frappe.qb.from_(item)
+			.select(item.name, item.item_name, item.description, item.stock_uom)
+			.where(item.name.isin(chunk))
+		).run(as_dict=1):
+			item_map[d.name] = d
+
+	return {d: item_map[d] for d in item_codes if d in item_map}
@@ -3,87 +3,63 @@
 
 import frappe
 from frappe import _, scrub
+from frappe.utils import add_days, getdate
+
+from cbn.cbn.doctype.work_order_progress.work_order_progress import OPERATION_FIELDS
 
 def execute(filters=None):
 	data = [] # get_result(filters)
 	work_order, additional_columns = get_work_order(filters)
-	manufacture = get_manufacture(list(work_order.keys()))
 	columns = get_columns(filters, additional_columns)
 
 	for wo, value in work_order.items():
 		data.append({
 			"work_order": wo,
 			**value,
-			**manufacture.get(wo, {})
 		})
 
 	return columns, data
 
 def get_work_order(filters):
+	wop = frappe.qb.DocType("Work Order Progress")
 	wo = frappe.qb.DocType("Work Order")
-	jc = frappe.qb.DocType("Job Card")
 
 	query = (
-		frappe.qb.from_(wo)
-		.inner_join(jc)
-		.on((jc.work_order == wo.name) & (jc.docstatus == 1))
+		frappe.qb.from_(wop)
+		.inner_join(wo)
+		.on(wo.name == wop.work_order)
 		.select(
-			wo.name, wo.custom_batch, wo.batch_size, wo.production_item,
-			jc.operation, jc.workstation, jc.total_completed_qty, jc.wip_warehouse, jc.actual_start_date, jc.actual_end_date
+			wop.work_order, wo.custom_batch.as_("batch"), wo.batch_size, wo.production_item, wop.operations,
+			*[wop[field] for fields in OPERATION_FIELDS.values() for field in fields], wop.tgl_kirim
 		)
 		.where(wo.docstatus == 1)
+		.orderby(wo.planned_start_date)
 	)
 
+	if filters.get("company"):
+		query = query.where(wo.company == filters.company)
+
 	if filters.get("batch"):
 		query = query.where(wo.custom_batch == filters.batch)
 
-	progress = query.run()
-	
+	if filters.get("from_date"):
+		query = query.where(wo.planned_start_date >= getdate(filters.from_date))
+
+	if filters.get("to_date"):
+		query = query.where(wo.planned_start_date < add_days(filters.to_date, 1))
+
+	if filters.get("status"):
+		query = query.where(wo.status == filters.status)
+
 	work_order, operation = {}, set()
-	wo_field = ["batch", "batch_size", "production_item"]
-	jc_field = ["operation", "workstation", "completed_qty", "wip_warehouse", "start_date", "end_date"]
-	for r in progress:
-		wo_list = work_order.setdefault(r[0], frappe._dict(zip(wo_field, r[1:4])))
-		
-		dict_operation = frappe._dict(zip(jc_field, r[4:]))
-		operation.add(dict_operation.operation)
-		if dict_operation.operation == "Timbang":
-			wo_list.update({ "tgl_timbang": dict_operation.start_date, "selesai_timbang": dict_operation.end_date })
-		elif dict_operation.operation == "Mixing":
-			wo_list.update({ "tgl_mixing": dict_operation.start_date })
-		elif dict_operation.operation == "Filling":
-			wo_list.update({ "tgl_filling": dict_operation.start_date, "aktual_filling": dict_operation.completed_qty })
-		elif dict_operation.operation == "Coding":
-			wo_list.update({ "tgl_coding": dict_operation.start_date, "qty_coding": dict_operation.completed_qty })
-		elif dict_operation.operation == "Packing":
-			wo_list.update({ "tgl_packing": dict_operation.start_date, "aktual_packing": dict_operation.completed_qty })
+	for r in query.run(as_dict=True):
+		operation.update((r.pop("operations") or "").split("\n"))
+		work_order[r.pop("work_order")] = r
 
 	additional_columns = operation_column(operation)
 	
 	return work_order, additional_columns
 
-def get_manufacture(wo_list):
-	ste = frappe.qb.DocType("Stock Entry")
-
-	query = (
-		frappe.qb.from_(ste)
-		.select(
-			ste.work_order, ste.posting_date
-		)
-		.where(
-			(ste.stock_entry_type == "Manufacture") & (ste.docstatus == 1)
-			& ste.work_order.isin(wo_list)
-		)
-	)
-
-	manufacture = query.run()
-	ste_field = ["tgl_kirim"]
-	brg_jadi = {}
-	for r in manufacture:
-		wo_list = brg_jadi.setdefault(r[0], frappe._dict(zip(ste_field, r[1:])))
-
-	return brg_jadi
-
 def get_result(filters):
 	ress = []
 
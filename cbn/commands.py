@@ -0,0 +1,26 @@
+# Copyright (c) 2025, DAS and Contributors
+# License: GNU General Public License v3. See license.txt
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-batch-manufacture-bin")
+@pass_context
+def rebuild_batch_manufacture_bin(context):
+	"""Recompute Batch Manufacture Bin balances from the Stock Ledger"""
+	import frappe
+
+	from cbn.cbn.doctype.batch_manufacture_bin.batch_manufacture_bin import rebuild_batch_manufacture_bin
+
+	site = get_site(context)
+	try:
+		frappe.init(site=site)
+		frappe.connect()
+		rebuild_batch_manufacture_bin()
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+
+commands = [rebuild_batch_manufacture_bin]
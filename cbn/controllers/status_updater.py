@@ -2,6 +2,7 @@
 # License: GNU General Public License v3. See license.txt
 
 import frappe
+from frappe.query_builder import Case
 
 def update_prev_doc(self, args):
     if self.docstatus == 1:
@@ -54,4 +55,21 @@ def update_percent_prev_doc(self, args):
             from `tab{target_dt}` where parent='{name}' and parenttype='{target_parent_dt}' {extra_parent_cond} having sum(abs({target_ref_field})) > 0), 0), 6)
             {update_modified}
         where name='{name}'""".format(**args)
-    )
\ No newline at end of file
+    )
+
+def update_child_values(doctype, fieldname, values, update_modified=False):
+    """Write `values` ({row name: value}) into `fieldname` of `doctype` with a single UPDATE"""
+    if not values:
+        return
+
+    table = frappe.qb.DocType(doctype)
+
+    case = Case()
+    for name, value in values.items():
+        case = case.when(table.name == name, value)
+
+    query = frappe.qb.update(table).set(table[fieldname], case).where(table.name.isin(list(values)))
+    if update_modified:
+        query = query.set(table.modified, frappe.utils.now())
+
+    query.run()
@@ -60,3 +60,57 @@ def make_quality_inspections(doctype, docname, items):
 
     return inspections
 
+def get_batch_details(batch_nos):
+    """disabled / expiry_date / item of each batch, fetched in one query and kept for the rest of the request"""
+    if frappe.flags.batch_details is None:
+        frappe.flags.batch_details = {}
+
+    batch_details = frappe.flags.batch_details
+    if missing := list({d for d in batch_nos if d and d not in batch_details}):
+        for d in frappe.get_all(
+            "Batch",
+            filters={"name": ("in", missing)},
+            fields=["name", "disabled", "expiry_date", "item"],
+        ):
+            batch_details[d.name] = d
+
+    return {d: batch_details.get(d) for d in batch_nos if d}
+
+def get_item_context(item_codes, company):
+    """Item fields with the item, item group and brand defaults of `company`,
+    fetched in two queries and kept for the rest of the request"""
+    if frappe.flags.item_context is None:
+        frappe.flags.item_context = {}
+
+    item_context = frappe.flags.item_context
+    if missing := list({d for d in item_codes if d and (company, d) not in item_context}):
+        items = frappe.get_all(
+            "Item",
+            filters={"name": ("in", missing)},
+            fields=["name", "item_name", "description", "stock_uom", "item_group", "brand"],
+        )
+
+        default_fields = ["default_warehouse", "expense_account", "buying_cost_center", "selling_cost_center"]
+        parents = set(missing) | {d.item_group for d in items if d.item_group} | {d.brand for d in items if d.brand}
+
+        defaults = {}
+        for d in frappe.get_all(
+            "Item Default",
+            filters={"parent": ("in", list(parents)), "parenttype": ("in", ["Item", "Item Group", "Brand"]), "company": company},
+            fields=["parent", "parenttype", *default_fields],
+            order_by="idx",
+        ):
+            defaults.setdefault((d.parenttype, d.parent), d)
+
+        def get_defaults(parenttype, parent):
+            # selalu berisi semua field, dict kosong membuat get_default_cost_center query ulang per item
+            row = defaults.get((parenttype, parent)) or {}
+            return frappe._dict({field: row.get(field) for field in default_fields})
+
+        for d in items:
+            d.update(get_defaults("Item", d.name))
+            d.item_group_defaults = get_defaults("Item Group", d.item_group)
+            d.brand_defaults = get_defaults("Brand", d.brand)
+            item_context[(company, d.name)] = d
+
+    return {d: item_context.get((company, d)) for d in item_codes if d}
@@ -161,17 +161,36 @@ doc_events = {
 		"validate": "cbn.cbn.custom.item.validate_item_parent"
 	},
     "BOM": {
-        "validate": "cbn.cbn.custom.bom.calculate_total_qty"
+        "validate": "cbn.cbn.custom.bom.calculate_total_qty",
+        "on_update": "cbn.cbn.bom_explosion.clear_bom_explosion_cache",
+        "on_submit": "cbn.cbn.bom_explosion.clear_bom_explosion_cache",
+        "on_cancel": "cbn.cbn.bom_explosion.clear_bom_explosion_cache",
+        "on_update_after_submit": "cbn.cbn.bom_explosion.clear_bom_explosion_cache",
     },
     "Stock Entry": {
-        "on_submit": "cbn.cbn.custom.stock_entry.validate_and_update_loss_item",
-        "on_cancel": "cbn.cbn.custom.stock_entry.validate_and_update_loss_item",
+        "on_submit": [
+            "cbn.cbn.custom.stock_entry.validate_and_update_loss_item",
+            "cbn.cbn.doctype.work_order_progress.work_order_progress.update_progress_from_stock_entry",
+            "cbn.cbn.doctype.work_order_material_balance.work_order_material_balance.update_material_balance_from_stock_entry",
+        ],
+        "on_cancel": [
+            "cbn.cbn.custom.stock_entry.validate_and_update_loss_item",
+            "cbn.cbn.doctype.work_order_progress.work_order_progress.update_progress_from_stock_entry",
+            "cbn.cbn.doctype.work_order_material_balance.work_order_material_balance.update_material_balance_from_stock_entry",
+        ],
         "validate": "cbn.cbn.custom.stock_entry.calculate_total_qty"
     },
+    "Job Card": {
+        "on_submit": "cbn.cbn.doctype.work_order_progress.work_order_progress.update_progress_from_job_card",
+        "on_cancel": "cbn.cbn.doctype.work_order_progress.work_order_progress.update_progress_from_job_card",
+    },
     "Production Plan": {
         "on_submit": ["cbn.cbn.custom.production_plan.update_batch_manufacture", "cbn.cbn.custom.production_plan.add_conversion_batch_manufacture"],
         "on_cancel": ["cbn.cbn.custom.production_plan.update_batch_manufacture"],
 	},
+    "Repost Item Valuation": {
+        "on_submit": "cbn.cbn.doctype.batch_manufacture_period_balance.batch_manufacture_period_balance.invalidate_period_balances_for_repost",
+    },
     "Quality Inspection": {
         "validate": "cbn.cbn.custom.quality_inspection.set_job_card_bm"
 	},
@@ -186,23 +205,13 @@ doc_events = {
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"cbn.tasks.all"
-# 	],
-# 	"daily": [
-# 		"cbn.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"cbn.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"cbn.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"cbn.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"daily": [
+		"cbn.cbn.batch_manufacture.reconcile_batch_qty",
+		"cbn.cbn.doctype.batch_manufacture_period_balance.batch_manufacture_period_balance.make_period_balances",
+		"cbn.cbn.doctype.batch_manufacture_daily_summary.batch_manufacture_daily_summary.roll_daily_summary"
+	],
+}
 
 # Testing
 # -------
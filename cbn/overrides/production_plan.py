@@ -6,6 +6,9 @@ from frappe.utils import flt
 
 from erpnext.manufacturing.doctype.production_plan.production_plan import ProductionPlan
 
+# BOM yang dibaca saat menyusun bahan (get_items_for_material_requests) tetap dari ERPNext:
+# query-nya di-join dengan Item / Item Default sehingga tidak bisa di-cache per versi BOM,
+# dan hanya jalan sekali per klik, bukan per baris seperti Work Order / Stock Entry
 class ProductionPlan(ProductionPlan):
 
     def get_production_items(self):
@@ -16,6 +16,11 @@ from erpnext.stock.doctype.item.item import get_item_defaults
 from erpnext.manufacturing.doctype.bom.bom import add_additional_cost
 from erpnext.stock.doctype.stock_entry.stock_entry import FinishedGoodError, StockEntry, create_serial_and_batch_bundle
 
+from cbn.cbn.bom_explosion import get_bom_header, get_bom_item_qty
+from cbn.cbn.doctype.work_order_material_balance.work_order_material_balance import get_work_order_material_balance
+from cbn.controllers.stock_controller import get_batch_details, get_item_context
+from cbn.overrides.work_order import get_required_item_codes
+
 class StockEntry(StockEntry):
     # begin: auto-generated types
     # This code is auto-generated. Do not modify anything in this block.
@@ -99,39 +104,53 @@ class StockEntry(StockEntry):
         precision = frappe.get_precision("Stock Entry Detail", "qty")
         # get qty item per loss qty
         items = {}
-        for bom in frappe.get_all("BOM Item", 
-            filters={"parent": self.bom_no}, fields=["item_code", "qty"]):
-            items.setdefault(bom.item_code, flt(bom.qty * self.process_loss_qty, precision))
+        for item_code, qty in get_bom_item_qty(self.bom_no).items():
+            items.setdefault(item_code, flt(qty * self.process_loss_qty, precision))
         
-        loss_items = {}
-        removed_item = []
+        # flag goods_can_be_loss untuk semua perintah produksi sekaligus
+        perintah_produksi = list({d.perintah_produksi for d in self.items if d.perintah_produksi})
+        can_be_loss = set(
+            frappe.get_all(
+                "Perintah Produksi",
+                filters={"name": ("in", perintah_produksi), "goods_can_be_loss": 1},
+                pluck="name",
+            )
+        ) if perintah_produksi else set()
+
+        # sisa loss qty per (item, perintah produksi), dibagi ke baris sesuai urutan
+        remaining, loss_rows, removed_item = {}, [], []
         for d in self.items:
-            if not frappe.get_cached_value("Perintah Produksi", d.perintah_produksi, "goods_can_be_loss"):
+            if d.perintah_produksi not in can_be_loss:
                 continue
-            
-            key = (d.original_item or d.item_code, d.perintah_produksi)
-            loss_items.setdefault(key, 0)
-            process_loss_qty = items.get((d.original_item or d.item_code))
-            if not process_loss_qty:
-                frappe.throw("Item {} is not listed in the Bill of Materials {}".format((d.original_item or d.item_code), self.bom_no))
-            
-            # check apakah lost item sudah lebih besar atau tidak terhadap bom loss qty
-            if flt(loss_items[key], precision) >= process_loss_qty:
+
+            item_code = d.original_item or d.item_code
+            if not items.get(item_code):
+                frappe.throw("Item {} is not listed in the Bill of Materials {}".format(item_code, self.bom_no))
+
+            key = (item_code, d.perintah_produksi)
+            remaining.setdefault(key, items[item_code])
+            if flt(remaining[key], precision) <= 0:
                 continue
-            
-            item = d.as_dict(no_default_fields=True).copy()
-            
-            # check sisa loss qty
-            loss_qty = flt(process_loss_qty - loss_items[key], precision)
+
+            loss_qty = flt(remaining[key], precision)
             if d.qty <= loss_qty:
+                loss_rows.append((d, d.qty, None))
                 removed_item.append(d)
-                loss_qty = d.qty
             else:
-                item.update({"qty": loss_qty, "item_detail": d.name})
+                loss_rows.append((d, loss_qty, d.name))
+
+            remaining[key] = flt(remaining[key] - min(d.qty, loss_qty), precision)
+
+        loss_items = []
+        for d, loss_qty, item_detail in loss_rows:
+            item = d.as_dict(no_default_fields=True)
+            if item_detail:
+                item.update({"qty": loss_qty, "item_detail": item_detail})
                 d.qty = flt(d.qty - loss_qty, precision)
 
-            loss_items[key] += loss_qty
-            self.append("loss_items", item)
+            loss_items.append(item)
+
+        self.extend("loss_items", loss_items)
 
         for r in removed_item:
             self.remove(r)
@@ -166,7 +185,7 @@ class StockEntry(StockEntry):
         # ste = frappe.qb.DocType("Stock Entry")
         # ste_child = frappe.qb.DocType("Stock Entry Detail")
 
-        items = frappe.get_all("Work Order Item", filters={"parent": self.work_order }, pluck="item_code")
+        items = get_required_item_codes(self.work_order)
                          
         # item_list = {}
         for d in self.items:
@@ -265,11 +284,12 @@ class StockEntry(StockEntry):
             "Repack",
             "Send to Subcontractor",
         ]:
+            batch_details = get_batch_details([item.batch_no for item in self.get("items")])
             for item in self.get("items"):
                 if item.batch_no:
-                    disabled = frappe.db.get_value("Batch", item.batch_no, "disabled")
-                    if disabled == 0:
-                        expiry_date = frappe.db.get_value("Batch", item.batch_no, "expiry_date")
+                    batch = batch_details.get(item.batch_no) or frappe._dict()
+                    if batch.disabled == 0:
+                        expiry_date = batch.expiry_date
                         if expiry_date:
                             if getdate(self.posting_date) > getdate(expiry_date):
                                 frappe.throw(
@@ -642,8 +662,9 @@ class StockEntry(StockEntry):
         )
 
         work_order_qty = wo.material_transferred_for_manufacturing or wo.qty
+        item_context = get_item_context([item.item_code for item in wo_items], self.company)
         for item in wo_items:
-            item_account_details = get_item_defaults(item.item_code, self.company)
+            item_account_details = item_context.get(item.item_code) or frappe._dict()
             # Take into account consumption if there are any.
 
             wo_item_qty = item.transferred_qty or item.required_qty
@@ -679,7 +700,7 @@ class StockEntry(StockEntry):
             to_warehouse = self.pro_doc.fg_warehouse
             custom_batch = self.pro_doc.custom_batch
         else:
-            item_code = frappe.db.get_value("BOM", self.bom_no, "item")
+            item_code = get_bom_header(self.bom_no).item
             to_warehouse = self.to_warehouse
 
         item = get_item_defaults(item_code, self.company)
@@ -816,6 +837,10 @@ class StockEntry(StockEntry):
 
     def add_to_stock_entry_detail(self, item_dict, bom_no=None):
         precision = frappe.get_precision("Stock Entry Detail", "qty")
+        item_context = get_item_context(
+            {cstr(d) for d in item_dict} | {row.get("item_code") for row in item_dict.values()}, self.company
+        )
+
         for d in item_dict:
             item_row = item_dict[d]
 
@@ -824,7 +849,7 @@ class StockEntry(StockEntry):
                 continue
 
             se_child = self.append("items")
-            stock_uom = item_row.get("stock_uom") or frappe.db.get_value("Item", d, "stock_uom")
+            stock_uom = item_row.get("stock_uom") or (item_context.get(cstr(d)) or {}).get("stock_uom")
             se_child.s_warehouse = item_row.get("from_warehouse")
             se_child.t_warehouse = item_row.get("to_warehouse")
             se_child.item_code = item_row.get("item_code") or cstr(d)
@@ -833,8 +858,8 @@ class StockEntry(StockEntry):
             se_child.qty = child_qty
             se_child.allow_alternative_item = item_row.get("allow_alternative_item", 0)
             se_child.subcontracted_item = item_row.get("main_item_code")
-            se_child.cost_center = item_row.get("cost_center") or get_default_cost_center(
-                item_row, company=self.company
+            se_child.cost_center = item_row.get("cost_center") or self.get_item_cost_center(
+                item_row, item_context.get(item_row.get("item_code"))
             )
             se_child.is_finished_item = item_row.get("is_finished_item", 0)
             se_child.is_scrap_item = item_row.get("is_scrap_item", 0)
@@ -873,14 +898,29 @@ class StockEntry(StockEntry):
             se_child.bom_no = bom_no  # to be assigned for finished item
             se_child.job_card_item = item_row.get("job_card_item") if self.get("job_card") else None
 
+    def get_item_cost_center(self, item_row, item):
+        if not item:
+            return get_default_cost_center(item_row, company=self.company)
+
+        # defaults sudah diambil sekaligus, tidak perlu query per item / item group / brand
+        return get_default_cost_center(
+            item_row, item=item, item_group=item.item_group_defaults, brand=item.brand_defaults, company=self.company
+        )
+
 def get_available_materials(work_order) -> dict:
-    data = get_stock_entry_data(work_order)
+    # saldo dijaga di Work Order Material Balance saat stock entry submit / cancel
+    return get_work_order_material_balance(work_order)
 
-    available_materials = {}
+def get_material_key(row):
+    if row.purpose == "Material Transfer for Manufacture":
+        return (row.item_code, row.warehouse)
+
+    return (row.item_code, row.s_warehouse)
+
+def apply_available_materials(available_materials, data):
+    """Add transferred rows to and subtract consumed rows from `available_materials`"""
     for row in data:
-        key = (row.item_code, row.warehouse)
-        if row.purpose != "Material Transfer for Manufacture":
-            key = (row.item_code, row.s_warehouse)
+        key = get_material_key(row)
 
         if key not in available_materials:
             available_materials.setdefault(
@@ -933,7 +973,7 @@ def get_available_materials(work_order) -> dict:
 
     return available_materials
 
-def get_stock_entry_data(work_order):
+def get_stock_entry_data(work_order, voucher_no=None):
     from erpnext.stock.doctype.serial_and_batch_bundle.serial_and_batch_bundle import (
         get_voucher_wise_serial_batch_from_bundle,
     )
@@ -941,7 +981,7 @@ def get_stock_entry_data(work_order):
     stock_entry = frappe.qb.DocType("Stock Entry")
     stock_entry_detail = frappe.qb.DocType("Stock Entry Detail")
 
-    data = (
+    query = (
         frappe.qb.from_(stock_entry)
         .from_(stock_entry_detail)
         .select(
@@ -980,7 +1020,12 @@ def get_stock_entry_data(work_order):
             )
         )
         .orderby(stock_entry.creation, stock_entry_detail.item_code, stock_entry_detail.idx)
-    ).run(as_dict=1)
+    )
+
+    if voucher_no:
+        query = query.where(stock_entry.name == voucher_no)
+
+    data = query.run(as_dict=1)
 
     if not data:
         return []
@@ -996,15 +1041,15 @@ def get_stock_entry_data(work_order):
             if bundle_data.get(key):
                 row.update(bundle_data.get(key))
 
-    data.extend(get_stock_entry_loss_item(work_order))
+    data.extend(get_stock_entry_loss_item(work_order, voucher_no))
 
     return data
 
-def get_stock_entry_loss_item(work_order):
+def get_stock_entry_loss_item(work_order, voucher_no=None):
 	stock_entry = frappe.qb.DocType("Stock Entry")
 	stock_entry_detail = frappe.qb.DocType("Stock Entry Detail Loss")
 
-	data = (
+	query = (
 		frappe.qb.from_(stock_entry)
 		.from_(stock_entry_detail)
 		.select(
@@ -1039,9 +1084,9 @@ def get_stock_entry_loss_item(work_order):
 			)
 		)
 		.orderby(stock_entry.creation, stock_entry_detail.item_code, stock_entry_detail.idx)
-	).run(as_dict=1)
+	)
 
-	if not data:
-		return []
+	if voucher_no:
+		query = query.where(stock_entry.name == voucher_no)
 
-	return data
\ No newline at end of file
+	return query.run(as_dict=1)
\ No newline at end of file
@@ -1,20 +1,27 @@
 # Copyright (c) 2024, DAS and Contributors
 # License: GNU General Public License v3. See license.txt
 
+import frappe
 from erpnext.stock.doctype.stock_ledger_entry.stock_ledger_entry import StockLedgerEntry
 
-from cbn.cbn.batch_manufacture import BatchManufacture
+from cbn.cbn.batch_manufacture import make_batch_manufacture_entries
+from cbn.cbn.doctype.batch_manufacture_period_balance.batch_manufacture_period_balance import invalidate_period_balances
 
 class StockLedgerEntry(StockLedgerEntry):
     
      def on_submit(self):
         super().on_submit()
 
-        if not self.get("via_landed_cost_voucher"):
-            BatchManufacture(
-				sle=self,
-				item_code=self.item_code,
-				warehouse=self.warehouse,
-				company=self.company
-			)
-            
\ No newline at end of file
+        if self.get("via_landed_cost_voucher"):
+            # qty tidak berubah, tetapi nilai stok periode yang sudah ditutup ikut berubah
+            if self.custom_batch:
+                invalidate_period_balances(self.company, self.posting_date)
+            return
+
+        # diproses sekaligus setelah semua sle voucher masuk
+        sl_entries = frappe.flags.batch_manufacture_sl_entries
+        if sl_entries is not None:
+            sl_entries.append(self)
+            return
+
+        make_batch_manufacture_entries([self])
@@ -5,11 +5,11 @@ import frappe
 from frappe import _
 from frappe.utils import flt
 
-from pypika import functions as fn
-
 from erpnext.manufacturing.doctype.work_order.work_order import StockOverProductionError, WorkOrder
 
 from cbn.cbn.custom.bom import get_bom_items_as_dict
+from cbn.cbn.doctype.perintah_produksi.perintah_produksi import get_formula_factor
+from cbn.controllers.status_updater import update_child_values
 
 class WorkOrder(WorkOrder):
     
@@ -27,16 +27,16 @@ class WorkOrder(WorkOrder):
                 self.bom_no, self.company, qty=self.qty, fetch_exploded=self.use_multi_level_bom
             )
 
+            # formula perintah produksi dihitung sekali per work order
+            factors = {}
             if reset_only_qty:
                 for d in self.get("required_items"):
                     if item_dict.get((d.item_code, d.custom_perintah_produksi)):
-                        perintah_produksi = frappe.get_cached_value("Perintah Produksi", d.custom_perintah_produksi, ["formula"], as_dict=1) 
+                        if d.custom_perintah_produksi not in factors:
+                            factors[d.custom_perintah_produksi] = get_formula_factor(d.custom_perintah_produksi)
 
                         item_qty = item_dict.get((d.item_code, d.custom_perintah_produksi)).get("qty")
-                        if perintah_produksi and perintah_produksi.formula:
-                            item_qty = item_qty * eval(perintah_produksi.formula)
-
-                        d.required_qty = item_qty
+                        d.required_qty = item_qty * factors[d.custom_perintah_produksi]
 
                     if not d.operation:
                         d.operation = operation
@@ -49,11 +49,10 @@ class WorkOrder(WorkOrder):
                             lambda: frappe.get_value("Perintah Produksi Item", {"item_group": item.item_group}, "parent", order_by="is_default desc"),
                         )
                     
-                    perintah_produksi = frappe.get_cached_value("Perintah Produksi", pp_name, ["formula"], as_dict=1) 
+                    if pp_name not in factors:
+                        factors[pp_name] = get_formula_factor(pp_name)
 
-                    item_qty = item.qty
-                    if perintah_produksi and perintah_produksi.formula:
-                        item_qty = item.qty * eval(perintah_produksi.formula)
+                    item_qty = item.qty * factors[pp_name]
 
                     self.append(
                         "required_items",
@@ -83,6 +82,9 @@ class WorkOrder(WorkOrder):
         update bin reserved_qty_for_production
         called from Stock Entry for production, after submit, cancel
         """
+        # satu pembacaan stock entry untuk semua qty di bawah
+        self._material_ledger = None
+
         # calculate consumed qty based on submitted stock entries
         self.update_consumed_qty_for_required_items()
 
@@ -102,56 +104,22 @@ class WorkOrder(WorkOrder):
         against a work order for each stock item
         """
 
-        item_consumend = {}
+        item_consumend = self.get_consumed_qty_for_required_items()
         precision = frappe.get_precision('Work Order Item', "consumed_qty")
+
+        consumed_values = {}
         for item in self.required_items:
-            # set item yang belum ada pada dict
-            if not item_consumend.get(item.item_code):
-                filters = {"name": self.name, "item": item.item_code}
-                consumed_qty = frappe.db.sql("""
-                    SELECT SUM(qty) FROM (
-                        SELECT
-                            detail.qty
-                        FROM
-                            `tabStock Entry` entry,
-                            `tabStock Entry Detail` detail
-                        WHERE
-                            entry.work_order = %(name)s
-                                AND (entry.purpose = "Material Consumption for Manufacture"
-                                    OR entry.purpose = "Manufacture")
-                                AND entry.docstatus = 1
-                                AND detail.parent = entry.name
-                                AND detail.s_warehouse IS NOT null
-                                AND (detail.item_code = %(item)s
-                                    OR detail.original_item = %(item)s)
-
-                        UNION ALL
-
-                        SELECT
-                            detail_loss.qty
-                        FROM
-                            `tabStock Entry` entry_loss,
-                            `tabStock Entry Detail Loss` detail_loss
-                        WHERE
-                            entry_loss.work_order = %(name)s
-                                AND (entry_loss.purpose = "Material Consumption for Manufacture"
-                                    OR entry_loss.purpose = "Manufacture")
-                                AND entry_loss.docstatus = 1
-                                AND detail_loss.parent = entry_loss.name
-                                AND (detail_loss.item_code = %(item)s
-                                    OR detail_loss.original_item = %(item)s)
-                    ) AS combined
-                    """, filters)[0][0] or 0.0
-                
-                item_consumend.setdefault(item.item_code, (flt(consumed_qty) or 0.0))
-            
+            item_consumend.setdefault(item.item_code, 0.0)
+
             # jika item yang d konsumsi lebih besar dari transfer maka konsumsi barang sama dengan barang yang di kirim
-            item_to_consumed = item.transferred_qty if item_consumend[item.item_code] > (flt(item.transferred_qty) or 0.0) else item_consumend[item.item_code]
-            item.db_set("consumed_qty", item_to_consumed, update_modified=False)
+            item.consumed_qty = item.transferred_qty if item_consumend[item.item_code] > (flt(item.transferred_qty) or 0.0) else item_consumend[item.item_code]
+            consumed_values[item.name] = flt(item.consumed_qty)
 
             # kurangi jumlah barang yang di konsumsi untuk item yang sama
             item_consumend[item.item_code] = flt(item_consumend[item.item_code] - (flt(item.consumed_qty) or 0.0), precision)
 
+        update_child_values("Work Order Item", "consumed_qty", consumed_values)
+
         for item_code, consumed in item_consumend.items():
             # memastikan tidak ada barang yang konsumsi lebih besar dari barang yang d transfer
             if (flt(consumed) or 0.0) > 0:
@@ -163,76 +131,99 @@ class WorkOrder(WorkOrder):
                     )        
                 )
 
-            # item.db_set("consumed_qty", flt(consumed_qty), update_modified=False)
+    def get_material_ledger(self):
+        """All submitted stock entry rows of the work order in one read,
+        shared by the consumed, transferred, converted and returned qty updates"""
+        if getattr(self, "_material_ledger", None) is None:
+            self._material_ledger = frappe.db.sql("""
+                SELECT
+                    entry.purpose, entry.stock_entry_type, entry.is_return, entry.custom_perintah_produksi,
+                    detail.item_code, detail.original_item,
+                    detail.s_warehouse IS NOT null AS has_source, detail.t_warehouse IS NOT null AS has_target,
+                    SUM(detail.qty) AS qty
+                FROM
+                    `tabStock Entry` entry,
+                    `tabStock Entry Detail` detail
+                WHERE
+                    entry.work_order = %(name)s
+                        AND entry.docstatus = 1
+                        AND detail.parent = entry.name
+                GROUP BY
+                    entry.purpose, entry.stock_entry_type, entry.is_return, entry.custom_perintah_produksi,
+                    detail.item_code, detail.original_item, has_source, has_target
+
+                UNION ALL
+
+                SELECT
+                    entry_loss.purpose, entry_loss.stock_entry_type, entry_loss.is_return, entry_loss.custom_perintah_produksi,
+                    detail_loss.item_code, detail_loss.original_item,
+                    1 AS has_source, 0 AS has_target,
+                    SUM(detail_loss.qty) AS qty
+                FROM
+                    `tabStock Entry` entry_loss,
+                    `tabStock Entry Detail Loss` detail_loss
+                WHERE
+                    entry_loss.work_order = %(name)s
+                        AND entry_loss.purpose IN ("Material Consumption for Manufacture", "Manufacture")
+                        AND entry_loss.docstatus = 1
+                        AND detail_loss.parent = entry_loss.name
+                GROUP BY
+                    entry_loss.purpose, entry_loss.stock_entry_type, entry_loss.is_return, entry_loss.custom_perintah_produksi,
+                    detail_loss.item_code, detail_loss.original_item
+                """, {"name": self.name}, as_dict=1)
+
+        return self._material_ledger
+
+    def get_consumed_qty_for_required_items(self):
+        """Consumed qty per required item, a row with a substitute counts for both its item and original item"""
+        items = {d.item_code for d in self.required_items}
+
+        consumed_qty = {}
+        for d in self.get_material_ledger():
+            if d.purpose not in ("Material Consumption for Manufacture", "Manufacture") or not d.has_source:
+                continue
+
+            for item in {d.item_code, d.original_item}:
+                if item in items:
+                    consumed_qty[item] = consumed_qty.get(item, 0.0) + flt(d.qty)
+
+        return consumed_qty
 
     def update_converted_qty_for_production(self):
-        ste = frappe.qb.DocType("Stock Entry")
-        ste_child = frappe.qb.DocType("Stock Entry Detail")
-
-        query = (
-            frappe.qb.from_(ste)
-            .inner_join(ste_child)
-            .on(ste_child.parent == ste.name)
-            .select(
-                ste_child.item_code,
-                ste_child.original_item,
-                fn.Sum(ste_child.qty).as_("qty"),
-            )
-            .where(
-                (ste.docstatus == 1)
-                & (ste.work_order == self.name)
-                & (ste_child.item_code == self.production_item)
-                & (ste_child.s_warehouse.isnotnull())
-                & (ste_child.t_warehouse.isnull())
-                & (ste.stock_entry_type == "Manufacture Conversion")
-            )
-            .groupby(ste_child.item_code)
-        )
+        converted_qty = 0.0
+        for d in self.get_material_ledger():
+            if (
+                d.stock_entry_type == "Manufacture Conversion"
+                and d.item_code == self.production_item
+                and d.has_source
+                and not d.has_target
+                and (d.original_item or d.item_code) == self.production_item
+            ):
+                converted_qty += flt(d.qty)
 
-        data = query.run(as_dict=1) or []
-        transferred_items = frappe._dict({d.original_item or d.item_code: d.qty for d in data})
-        self.db_set("custom_converted_qty", (transferred_items.get(self.production_item) or 0.0), update_modified=False)
+        self.db_set("custom_converted_qty", converted_qty, update_modified=False)
 
     def update_transferred_qty_for_required_items(self):
-        ste = frappe.qb.DocType("Stock Entry")
-        ste_child = frappe.qb.DocType("Stock Entry Detail")
-
-        query = (
-            frappe.qb.from_(ste)
-            .inner_join(ste_child)
-            .on(ste_child.parent == ste.name)
-            .select(
-                ste.custom_perintah_produksi,
-                ste_child.item_code,
-                ste_child.original_item,
-                fn.Sum(ste_child.qty).as_("qty"),
-            )
-            .where(
-                (ste.docstatus == 1)
-                & (ste.work_order == self.name)
-                & (ste.purpose == "Material Transfer for Manufacture")
-                & (ste.is_return == 0)
-            )
-            .groupby(ste_child.item_code, ste.custom_perintah_produksi)
-        )
-
-        data = query.run(as_dict=1) or []
         transferred_items = {}
-        for d in data:
+        for d in self.get_material_ledger():
+            if d.purpose != "Material Transfer for Manufacture" or d.is_return:
+                continue
+
             key = (d.original_item or d.item_code, d.custom_perintah_produksi)
             transferred_items.setdefault(key, 0)
             transferred_items[key] += d.qty
 
-        transfered_percent = []
+        transfered_percent, transferred_values = [], {}
         precision = frappe.get_precision('Work Order Item', "transferred_qty")
         for row in self.required_items:
-            row.db_set(
-                "transferred_qty", flt(transferred_items.get((row.item_code, row.custom_perintah_produksi)) or 0.0, precision), update_modified=False
-            )
+            row.transferred_qty = flt(transferred_items.get((row.item_code, row.custom_perintah_produksi)) or 0.0, precision)
+            transferred_values[row.name] = row.transferred_qty
 
             transfer = row.transferred_qty if row.transferred_qty <= row.required_qty else row.required_qty
             transfered_percent.append(transfer/row.required_qty)
 
+        update_child_values("Work Order Item", "transferred_qty", transferred_values)
+
         if self.custom_use_perintah_produksi:
             min_trans = min(transfered_percent)
             adjusted_trans = 1 if min_trans > 0.9 else min_trans
@@ -241,32 +232,18 @@ class WorkOrder(WorkOrder):
             )
 
     def update_returned_raw_material(self):
-        ste = frappe.qb.DocType("Stock Entry")
-        ste_child = frappe.qb.DocType("Stock Entry Detail")
-
-        query = (
-            frappe.qb.from_(ste)
-            .inner_join(ste_child)
-            .on(ste_child.parent == ste.name)
-            .select(
-                ste_child.item_code,
-                ste_child.original_item,
-                fn.Sum(ste_child.qty).as_("qty"),
-            )
-            .where(
-                (ste.docstatus == 1)
-                & (ste.work_order == self.name)
-                & (ste.stock_entry_type == "Return of Remaining Goods")
-            )
-            .groupby(ste_child.item_code)
-        )
+        returned_items = {}
+        for d in self.get_material_ledger():
+            if d.stock_entry_type == "Return of Remaining Goods":
+                key = d.original_item or d.item_code
+                returned_items[key] = returned_items.get(key, 0.0) + flt(d.qty)
 
-        data = query.run(as_dict=1) or []
-        transferred_items = frappe._dict({d.original_item or d.item_code: d.qty for d in data})
+        returned_values = {}
         for row in self.required_items:
-            row.db_set(
-                "custom_remaining_goods", (transferred_items.get(row.item_code) or 0.0), update_modified=False
-            )
+            row.custom_remaining_goods = returned_items.get(row.item_code) or 0.0
+            returned_values[row.name] = row.custom_remaining_goods
+
+        update_child_values("Work Order Item", "custom_remaining_goods", returned_values)
 
     def update_work_order_qty(self):
         """Update **Manufactured Qty** and **Material Transferred for Qty** in Work Order
@@ -336,5 +313,23 @@ class WorkOrder(WorkOrder):
         self.update_status()
         production_plan.run_method("update_produced_pending_qty", produced_qty, self.production_plan_item)
 
+REQUIRED_ITEMS_EXPIRY = 6 * 60 * 60
+
+def get_required_item_codes(work_order):
+    """Set of required item codes of the work order, cached per version of the work order"""
+    if not work_order:
+        return set()
+
+    # versi ada di key, isi lama yang ditulis ulang oleh request yang kalah balapan tidak akan terbaca lagi
+    modified = frappe.db.get_value("Work Order", work_order, "modified")
+    key = f"cbn_work_order_required_items:{work_order}:{modified}"
+
+    items = frappe.cache.get_value(key)
+    if items is None:
+        items = set(frappe.get_all("Work Order Item", filters={"parent": work_order, "parenttype": "Work Order"}, pluck="item_code"))
+        frappe.cache.set_value(key, items, expires_in_sec=REQUIRED_ITEMS_EXPIRY)
+
+    return items
+
 def get_doctype_map(doctype, name, filters=None, order_by=None):
 	return 
\ No newline at end of file
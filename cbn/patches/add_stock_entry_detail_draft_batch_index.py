@@ -0,0 +1,5 @@
+import frappe
+
+
+def execute():
+	frappe.db.add_index("Stock Entry Detail", ["docstatus", "batch_no"], index_name="docstatus_batch_no_index")
@@ -0,0 +1,5 @@
+from cbn.cbn.doctype.batch_manufacture_bin.batch_manufacture_bin import rebuild_batch_manufacture_bin
+
+
+def execute():
+	rebuild_batch_manufacture_bin()
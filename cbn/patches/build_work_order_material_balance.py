@@ -0,0 +1,16 @@
+import frappe
+
+from cbn.cbn.doctype.work_order_material_balance.work_order_material_balance import (
+	MATERIAL_PURPOSES,
+	rebuild_work_order_material_balance,
+)
+
+
+def execute():
+	for work_order in frappe.get_all(
+		"Stock Entry",
+		filters={"docstatus": 1, "work_order": ("is", "set"), "purpose": ("in", MATERIAL_PURPOSES)},
+		pluck="work_order",
+		distinct=True,
+	):
+		rebuild_work_order_material_balance(work_order)
@@ -0,0 +1,10 @@
+import frappe
+
+from cbn.cbn.doctype.work_order_progress.work_order_progress import update_work_order_progress
+
+
+def execute():
+	for work_order in frappe.get_all(
+		"Job Card", filters={"docstatus": 1, "work_order": ("is", "set")}, pluck="work_order", distinct=True
+	):
+		update_work_order_progress(work_order)